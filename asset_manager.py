@@ -0,0 +1,205 @@
+"""
+アセットの読み込み
+
+背景画像、アイコン、フォントはプロセス全体で1回だけ読み込んで使い回す。
+リスタートや難易度変更のたびに読み込み直さない（BGMと効果音はaudio.py）。
+"""
+import json
+import os
+
+import pygame
+
+from renderer import SCREEN_WIDTH, SCREEN_HEIGHT, WHITE, FADE_STEPS, build_fade_ramp
+
+# アセットのパス
+BG_IMAGE_PATH = 'assets/bg.jpg'
+
+# アイコンのアトラス（update_icons.pyで作成）
+ICON_ATLAS_PATH = 'assets/icons_atlas.png'
+ICON_ATLAS_MANIFEST_PATH = 'assets/icons_atlas.json'
+
+# フォントの設定
+# 同梱の日本語フォント（download_font.pyで取得）を最優先で使う
+BUNDLED_FONT_PATH = 'assets/NotoSansJP-Regular.otf'
+FONT_CANDIDATES = [
+    BUNDLED_FONT_PATH,
+    # macOSの日本語フォント
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+    # Windowsの日本語フォント
+    "C:\\Windows\\Fonts\\msgothic.ttc",
+    # Linuxの日本語フォント
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf",
+]
+
+# 見つけたフォントのパスを覚えておくファイル
+FONT_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "aws-tsuyo-tsuyo", "font.json"
+)
+
+# 未探索を表す値（見つからなかった場合はNoneを覚える）
+_UNRESOLVED = object()
+_font_path = _UNRESOLVED
+
+def probe_font_path():
+    """候補を順に試して、使える日本語フォントのパスを返す（無ければNone）"""
+    for path in FONT_CANDIDATES:
+        if not os.path.exists(path):
+            continue
+        try:
+            pygame.font.Font(path, 12)
+            return path
+        except (OSError, pygame.error):
+            continue
+    return None
+
+def find_font_path():
+    """
+    使う日本語フォントのパスを返す（無ければNone）
+
+    結果はプロセス内で覚えておき、キャッシュファイルにも書いておくので
+    次回以降の起動でも候補を試し直さない。
+    """
+    global _font_path
+    if _font_path is not _UNRESOLVED:
+        return _font_path
+
+    # 同梱フォントがあればそれを使う
+    if os.path.exists(BUNDLED_FONT_PATH):
+        _font_path = BUNDLED_FONT_PATH
+        return _font_path
+
+    # 前回見つけたフォントがまだあればそれを使う（候補が変わっていたら探し直す）。
+    # 見つからなかった場合は、あとでフォントを入れたかもしれないので毎回探し直す
+    try:
+        with open(FONT_CACHE_PATH) as f:
+            cache = json.load(f)
+        cached = cache['path']
+        if cache['candidates'] == FONT_CANDIDATES and cached is not None and os.path.exists(cached):
+            _font_path = cached
+            return _font_path
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    _font_path = probe_font_path()
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_PATH), exist_ok=True)
+        with open(FONT_CACHE_PATH, 'w') as f:
+            json.dump({'path': _font_path, 'candidates': FONT_CANDIDATES}, f, ensure_ascii=False)
+    except OSError:
+        pass
+    return _font_path
+
+def get_font(size):
+    """日本語フォントを作る（見つからなければデフォルトフォント）"""
+    path = find_font_path()
+    if path is not None:
+        try:
+            return pygame.font.Font(path, size)
+        except (OSError, pygame.error):
+            pass
+    # それでもダメならデフォルトフォント（SysFontと違いシステムフォントを走査しない）
+    return pygame.font.Font(None, size)
+
+# アイコンの読み込み関数
+def load_aws_icons(count=20):
+    """
+    assetsフォルダからAWSアイコンを読み込む
+    """
+    icon_paths = []
+    for i in range(count):
+        icon_path = f'assets/icon_{i}.png'
+        if os.path.exists(icon_path):
+            icon_paths.append(icon_path)
+
+    # 十分なアイコンがない場合はエラーメッセージを表示
+    if len(icon_paths) < count:
+        print(f"Warning: Requested {count} icons but only found {len(icon_paths)}")
+
+    return icon_paths
+
+def load_icon_atlas(count=20):
+    """
+    アトラス画像からアイコンを読み込む
+
+    (アトラス画像, 各アイコンの矩形のリスト)を返す。アトラスが無いか、
+    アイコンが足りない場合はNoneを返す（個別のPNGを使う）。
+    """
+    if not (os.path.exists(ICON_ATLAS_PATH) and os.path.exists(ICON_ATLAS_MANIFEST_PATH)):
+        return None
+    try:
+        with open(ICON_ATLAS_MANIFEST_PATH) as f:
+            manifest = json.load(f)
+        rects = [pygame.Rect(rect) for rect in manifest['icons'][:count]]
+        if len(rects) < count:
+            return None
+        atlas = pygame.image.load(ICON_ATLAS_PATH)
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        return atlas, rects
+    except (OSError, ValueError, KeyError, pygame.error) as e:
+        print(f"アトラスの読み込みに失敗しました: {e}")
+        return None
+
+
+class AssetManager:
+    def __init__(self):
+        self.fonts = {}  # サイズごとのフォント
+        self.backgrounds = {}
+        self.icon_sets = {}
+
+    def font(self, size):
+        """指定サイズのフォントを取得"""
+        if size not in self.fonts:
+            self.fonts[size] = get_font(size)
+        return self.fonts[size]
+
+    def background(self, size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+        """画面サイズに拡大縮小した背景画像を取得"""
+        if size not in self.backgrounds:
+            try:
+                bg_image = pygame.image.load(BG_IMAGE_PATH)
+                bg_image = pygame.transform.scale(bg_image, size)
+            except (OSError, pygame.error):
+                # 背景画像が読み込めない場合は白色の背景を使用
+                bg_image = pygame.Surface(size)
+                bg_image.fill(WHITE)
+            if pygame.display.get_surface() is not None:
+                bg_image = bg_image.convert()
+            self.backgrounds[size] = bg_image
+        return self.backgrounds[size]
+
+    def icons(self, count, fade_steps=FADE_STEPS):
+        """
+        指定数のアイコンを取得
+
+        'icons'（アイコン画像のリスト）、'atlas'と'rects'（アトラスが無ければNone）、
+        'fade_ramps'（消えるアニメーション用の半透明画像）を持つ辞書を返す。
+        """
+        key = (count, fade_steps)
+        if key not in self.icon_sets:
+            # アトラスがあれば1枚の画像から切り出す
+            atlas = load_icon_atlas(count)
+            if atlas is not None:
+                atlas_image, rects = atlas
+                icons = [atlas_image.subsurface(rect) for rect in rects]
+            else:
+                # 無ければ個別のPNGを読み込む
+                atlas_image, rects = None, None
+                icons = [pygame.image.load(path) for path in load_aws_icons(count)]
+
+            self.icon_sets[key] = {
+                'icons': icons,
+                'atlas': atlas_image,
+                'rects': rects,
+                # 消えるアニメーション用の半透明画像を先に作っておく
+                'fade_ramps': [build_fade_ramp(icon, fade_steps) for icon in icons],
+            }
+        return self.icon_sets[key]
+
+
+# プロセス全体で共有するアセット
+asset_manager = AssetManager()
@@ -0,0 +1,192 @@
+"""
+サウンドの管理
+
+ミキサーはpygame.initの前にpre_initで小さいバッファを指定しておき、効果音の遅れを短くする。
+BGMはプロセス全体で1回だけ読み込んでストリーミング再生する。効果音は起動時に
+すべてメモリ上のSoundにデコードしておき、鳴らすときはチャンネルに渡すだけにする。
+効果音ごとに使えるチャンネルの数を決めておき、埋まっていたら一番古いものを止めて鳴らすので、
+大連鎖で鳴らし続けてもミキサーが埋まらない。
+
+効果音のファイル（SOUND_EFFECTSの'path'）が無ければ、'notes'から短い音を合成する。
+"""
+import os
+from array import array
+
+import pygame
+
+# ミキサーの設定（pygame.initより前にpre_initで指定する）
+MIXER_FREQUENCY = 44100
+MIXER_SIZE = -16  # 符号付き16ビット
+MIXER_CHANNELS = 2  # ステレオ（BGMをそのまま鳴らす）
+MIXER_BUFFER = 256  # サンプル数（pygameの既定は512）。小さいほど遅れが短いが、音が途切れやすくなる
+
+BGM_PATH = 'assets/bgm.mp3'
+
+# 効果音の名前 -> 設定
+# 'path'のファイルが無ければ'notes'（(周波数, 秒)の並び）から合成する。
+# 'channels'はその効果音が同時に使えるチャンネルの数
+SOUND_EFFECTS = {
+    "move": {'path': 'assets/se_move.wav', 'notes': [(880, 0.02)], 'channels': 2, 'volume': 0.2},
+    "rotate": {'path': 'assets/se_rotate.wav', 'notes': [(1320, 0.03)], 'channels': 2, 'volume': 0.25},
+    "lock": {'path': 'assets/se_lock.wav', 'notes': [(220, 0.05)], 'channels': 2, 'volume': 0.4},
+    "clear": {'path': 'assets/se_clear.wav', 'notes': [(1047, 0.04), (1568, 0.08)], 'channels': 2, 'volume': 0.35},
+    "chain": {'path': 'assets/se_chain.wav', 'notes': [(523, 0.05), (784, 0.12)], 'channels': 4, 'volume': 0.45},
+    "game_over": {'path': 'assets/se_game_over.wav', 'notes': [(392, 0.15), (330, 0.15), (262, 0.3)],
+                  'channels': 1, 'volume': 0.5},
+}
+
+# 連鎖の効果音は連鎖数ごとに半音ずつ高くする（この連鎖数より上は同じ高さ）
+CHAIN_PITCH_LEVELS = 8
+
+
+def pre_init():
+    """pygame.initの前に呼んで、ミキサーの設定を指定する"""
+    pygame.mixer.pre_init(MIXER_FREQUENCY, MIXER_SIZE, MIXER_CHANNELS, MIXER_BUFFER)
+
+
+def synthesize(notes, frequency, channels, pitch=1.0):
+    """
+    (周波数, 秒)の並びから、減衰する矩形波の16ビットPCMのバイト列を作る
+
+    pitchは周波数に掛ける倍率。
+    """
+    samples = array('h')
+    for note_frequency, seconds in notes:
+        length = int(frequency * seconds)
+        period = frequency / (note_frequency * pitch)
+        for i in range(length):
+            envelope = 1 - i / length
+            level = 1 if (i % period) < period / 2 else -1
+            value = int(level * envelope * 12000)
+            samples.extend([value] * channels)
+    return samples.tobytes()
+
+
+class AudioManager:
+    def __init__(self):
+        self.ready = False  # ミキサーが使えて、効果音を用意できたか
+        self.sounds = {}  # 効果音の名前 -> Soundのリスト（連鎖は高さごと、それ以外は1つ）
+        self.channel_groups = {}  # 効果音の名前 -> 使うチャンネル番号のリスト
+        self.next_channel = {}  # 効果音の名前 -> 次に使うチャンネルの位置（空きが無いときに止める順番）
+        self.bgm_loaded = None  # None: 未読み込み、True/False: 読み込みに成功したか
+        self.music_on = False
+        self.effects_on = True
+
+        # 統計
+        self.played = 0
+        self.stolen = 0  # チャンネルが埋まっていて、鳴っている音を止めて鳴らした回数
+
+    def init(self):
+        """ミキサーを初期化して効果音を用意する（2回目以降は何もしない）。使えるかどうかを返す"""
+        if self.ready:
+            return True
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            frequency, size, channels = pygame.mixer.get_init()
+        except (pygame.error, TypeError):
+            print("サウンドが使えないため、音を鳴らしません")
+            return False
+        if size != MIXER_SIZE:
+            print(f"ミキサーの形式が違うため（{size}ビット）、効果音を合成できません")
+
+        # 効果音ごとにチャンネルを割り当て、自動で選ばれないように予約する
+        total = sum(effect['channels'] for effect in SOUND_EFFECTS.values())
+        pygame.mixer.set_num_channels(total)
+        pygame.mixer.set_reserved(total)
+        first = 0
+        for name, effect in SOUND_EFFECTS.items():
+            self.channel_groups[name] = list(range(first, first + effect['channels']))
+            self.next_channel[name] = 0
+            first += effect['channels']
+
+            # 再生中にデコードしないように、ここでメモリに読み込んでおく
+            sounds = []
+            if os.path.exists(effect['path']):
+                try:
+                    sounds.append(pygame.mixer.Sound(effect['path']))
+                except pygame.error:
+                    print(f"効果音の読み込みに失敗しました: {effect['path']}")
+            if not sounds and size == MIXER_SIZE:
+                levels = CHAIN_PITCH_LEVELS if name == "chain" else 1
+                for level in range(levels):
+                    pcm = synthesize(effect['notes'], frequency, channels, 2 ** (level / 12))
+                    sounds.append(pygame.mixer.Sound(buffer=pcm))
+            for sound in sounds:
+                sound.set_volume(effect['volume'])
+            self.sounds[name] = sounds
+
+        self.ready = True
+        return True
+
+    def buffer_latency_ms(self):
+        """ミキサーのバッファ1つぶんの遅れ（ミリ秒）"""
+        init = pygame.mixer.get_init()
+        if not init:
+            return 0.0
+        return MIXER_BUFFER / init[0] * 1000
+
+    def play(self, name, level=0):
+        """
+        効果音を鳴らす（levelは連鎖の効果音の高さ）
+
+        その効果音のチャンネルに空きが無ければ、一番前に鳴らしたものを止めて鳴らす。
+        """
+        if not self.ready or not self.effects_on:
+            return
+        sounds = self.sounds.get(name)
+        if not sounds:
+            return
+        sound = sounds[min(level, len(sounds) - 1)]
+
+        group = self.channel_groups[name]
+        start = self.next_channel[name]
+        channel = None
+        for i in range(len(group)):
+            candidate = pygame.mixer.Channel(group[(start + i) % len(group)])
+            if not candidate.get_busy():
+                channel = candidate
+                start = (start + i) % len(group)
+                break
+        if channel is None:
+            channel = pygame.mixer.Channel(group[start])
+            self.stolen += 1
+        self.next_channel[name] = (start + 1) % len(group)
+        channel.play(sound)
+        self.played += 1
+
+    def start_bgm(self):
+        """BGMを再生する（プロセス全体で1回だけ読み込む）。BGMが使えるかどうかを返す"""
+        if self.bgm_loaded is None:
+            try:
+                pygame.mixer.music.load(BGM_PATH)
+                pygame.mixer.music.play(-1)  # -1は無限ループ
+                self.bgm_loaded = True
+                self.music_on = True
+            except pygame.error:
+                print("BGMの読み込みに失敗しました")
+                self.bgm_loaded = False
+        return self.bgm_loaded
+
+    def set_music(self, on):
+        """BGMの一時停止/再開"""
+        if not self.bgm_loaded:
+            return
+        self.music_on = on
+        if on:
+            pygame.mixer.music.unpause()
+        else:
+            pygame.mixer.music.pause()
+
+    def set_enabled(self, on):
+        """BGMと効果音をまとめてオン/オフ"""
+        self.effects_on = on
+        self.set_music(on)
+        if not on and self.ready:
+            for group in self.channel_groups.values():
+                for index in group:
+                    pygame.mixer.Channel(index).stop()
+
+
+# プロセス全体で共有するサウンド
+audio = AudioManager()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+NumPyでまとめて進めるバッチシミュレーター
+
+N個のゲームの盤面を1つの(N, 高さ, 幅)の整数配列で持ち、ぷよの配置、重力、
+4つ以上つながったグループの検出、消去、得点計算をすべて配列演算でまとめて行う。
+難易度（アイコンの種類数）や得点の調整のために、大量の配置を高速に試すためのもの。
+
+配置は(列, 向き)で指定し、その位置に真上から落としたのと同じ結果になる
+（途中の障害物で届かない場所かどうかは見ない）。ぷよの並び、連鎖、得点、
+ゲームオーバーの判定はPuyoEngineと完全に同じで、play_scalarと比べて確かめられる。
+
+numpyが必要（`uv sync --extra batch`）。
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from engine import PuyoEngine, DIFFICULTY_LEVELS, GRID_WIDTH, GRID_HEIGHT, CHAIN_DELAY
+
+# 空きセルの値
+EMPTY = -1
+
+# 向きごとの、1つ目のぷよから見た2つ目のぷよの位置（rotate_puyoと同じ時計回りの順）
+ROTATION_OFFSETS = np.array([(0, 1), (-1, 0), (0, -1), (1, 0)])
+
+
+def collapse(boards):
+    """各列のぷよを順番を保ったまま下に詰める"""
+    # 空きを上、ぷよを下に並べ替える（安定ソートなので縦の順番は変わらない）
+    order = np.argsort(boards != EMPTY, axis=1, kind='stable')
+    return np.take_along_axis(boards, order, axis=1)
+
+
+def label_groups(boards):
+    """
+    同じアイコンが4方向につながったグループごとに同じ番号を付ける
+
+    番号はグループ内で一番小さいセルの通し番号。隣の小さい番号を取り込むのと、
+    番号が指すセルの番号に飛ぶのを、変わらなくなるまで繰り返す。
+    盤面ごとに空きの列と行を1つずつ足して1次元に並べるので、隣のセルは
+    常に同じだけ離れた位置にあり、隣の盤面とつながることもない。
+    """
+    n, height, width = boards.shape
+    padded = np.full((n, height + 1, width + 1), EMPTY, dtype=boards.dtype)
+    padded[:, :height, :width] = boards
+    cells = padded.ravel()
+    stride = width + 1
+
+    filled = cells != EMPTY
+    same_right = filled[:-1] & (cells[:-1] == cells[1:])
+    same_down = filled[:-stride] & (cells[:-stride] == cells[stride:])
+
+    labels = np.arange(cells.size, dtype=np.int32)
+    while True:
+        merged = labels.copy()
+        np.minimum(merged[:-1], labels[1:], out=merged[:-1], where=same_right)
+        np.minimum(merged[1:], labels[:-1], out=merged[1:], where=same_right)
+        np.minimum(merged[:-stride], labels[stride:], out=merged[:-stride], where=same_down)
+        np.minimum(merged[stride:], labels[:-stride], out=merged[stride:], where=same_down)
+        merged = merged[merged]
+        if np.array_equal(merged, labels):
+            return labels.reshape(n, height + 1, width + 1)[:, :height, :width]
+        labels = merged
+
+
+def find_clears(boards, min_size=4):
+    """min_size個以上つながったセルのマスクを返す"""
+    labels = label_groups(boards)
+    sizes = np.bincount(labels.ravel())
+    return (boards != EMPTY) & (sizes[labels] >= min_size)
+
+
+class BatchEngine:
+    """
+    複数のゲームをまとめて進めるエンジン
+
+    seedsはゲームごとのシードで、同じシードのPuyoEngineと同じ順番でぷよが出る。
+    """
+
+    def __init__(self, seeds, icon_count, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.icon_count = icon_count
+        self.width = width
+        self.height = height
+        n = len(seeds)
+
+        self.boards = np.full((n, height, width), EMPTY, dtype=np.int8)
+        self.scores = np.zeros(n, dtype=np.int64)
+        self.max_chains = np.zeros(n, dtype=np.int32)
+        self.placements = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+
+        # ぷよの並びはゲームごとの乱数でPuyoEngine.create_new_puyoと同じように引く
+        self.rngs = [random.Random(seed) for seed in seeds]
+        self.current = self.draw_pairs(np.arange(n))
+        self.next = self.draw_pairs(np.arange(n))
+
+        # 新しいぷよの出現位置（PuyoEngine.spawn_positionと同じ）。ここが埋まるとゲームオーバー
+        self.spawn_x = width // 2 - 1
+        self.spawn_rows = [0, 1]
+
+    def draw_pairs(self, games):
+        """指定したゲームの新しいぷよのアイコンを引く"""
+        last = self.icon_count - 1
+        pairs = [(self.rngs[i].randint(0, last), self.rngs[i].randint(0, last)) for i in games]
+        return np.array(pairs, dtype=np.int8).reshape(len(games), 2)
+
+    def place(self, columns, rotations):
+        """
+        ゲームごとに今のぷよを(列, 向き)に落とし、連鎖を最後まで進める
+
+        終わったゲームは何もしない。このステップの得点と連鎖数の配列を返す。
+        """
+        n = len(self.boards)
+        active = np.flatnonzero(~self.game_over)
+        gained = np.zeros(n, dtype=np.int64)
+        chains = np.zeros(n, dtype=np.int32)
+        if not len(active):
+            return gained, chains
+
+        columns = np.asarray(columns)[active]
+        dx, dy = ROTATION_OFFSETS[np.asarray(rotations)[active]].T
+        x1 = columns
+        x2 = columns + dx
+        if ((x1 < 0) | (x1 >= self.width) | (x2 < 0) | (x2 >= self.width)).any():
+            raise ValueError("盤面の外に置こうとしています")
+
+        boards = self.boards[active]
+        rows = np.arange(len(active))
+
+        # 列ごとの一番上の空き行（盤面は常に下に詰まっている）
+        heights = (boards != EMPTY).sum(axis=1)
+        top1 = self.height - 1 - heights[rows, x1]
+        top2 = self.height - 1 - heights[rows, x2]
+
+        # 2つのぷよが一緒に止まる位置（縦なら下になる方が列の一番上）。横なら高い方の列で止まり、
+        # 固定したあとの重力で低い方が落ちる。画面より上に出たぷよは置かれない
+        y1 = np.where(dx == 0, np.where(dy > 0, top1 - 1, top1), np.minimum(top1, top2))
+        y2 = y1 + dy
+        pairs = self.current[active]
+        for x, y, icons in ((x1, y1, pairs[:, 0]), (x2, y2, pairs[:, 1])):
+            visible = y >= 0
+            boards[rows[visible], y[visible], x[visible]] = icons[visible]
+        boards = collapse(boards)
+
+        # 1回目の連鎖判定（PuyoEngine.lock_puyoと同じく、消す前にゲームオーバーを判定する）
+        clears = find_clears(boards)
+        cleared = clears.sum(axis=(1, 2))
+        step_gained = cleared * 10
+        step_chains = (cleared > 0).astype(np.int32)
+        over = (boards[:, self.spawn_rows, self.spawn_x] != EMPTY).any(axis=1)
+
+        # 連鎖が続くゲームだけ、消して詰めて判定し直す
+        going = np.flatnonzero((cleared > 0) & ~over)
+        while len(going):
+            sub = boards[going]
+            sub[clears[going]] = EMPTY
+            sub = collapse(sub)
+            boards[going] = sub
+            sub_clears = find_clears(sub)
+            sub_cleared = sub_clears.sum(axis=(1, 2))
+            step_gained[going] += sub_cleared * 10
+            step_chains[going] += sub_cleared > 0
+            clears[going] = sub_clears
+            going = going[sub_cleared > 0]
+
+        self.boards[active] = boards
+        self.scores[active] += step_gained
+        self.max_chains[active] = np.maximum(self.max_chains[active], step_chains)
+        self.placements[active] += 1
+        self.game_over[active] = over
+        gained[active] = step_gained
+        chains[active] = step_chains
+
+        # 次のぷよを出す（終わったゲームは引かない）
+        alive = active[~over]
+        self.current[alive] = self.next[alive]
+        self.next[alive] = self.draw_pairs(alive)
+        return gained, chains
+
+    def random_moves(self, rng):
+        """ゲームごとにランダムな(列, 向き)を選ぶ（numpy.random.Generatorを使う）"""
+        n = len(self.boards)
+        rotations = rng.integers(0, 4, n)
+        dx = ROTATION_OFFSETS[rotations][:, 0]
+        low = np.maximum(0, -dx)
+        high = np.minimum(self.width - 1, self.width - 1 - dx)
+        columns = low + (rng.random(n) * (high - low + 1)).astype(np.int64)
+        return columns, rotations
+
+
+def drop_position(engine, column, rotation):
+    """PuyoEngineの盤面で、(列, 向き)に落としたときに止まる位置を返す"""
+    dx, dy = (int(v) for v in ROTATION_OFFSETS[rotation])
+
+    def top(x):
+        return engine.height - engine.board.heights[x] - 1
+
+    if dx == 0:
+        y = top(column) - 1 if dy > 0 else top(column)
+    else:
+        y = min(top(column), top(column + dx))
+    return [(column, y), (column + dx, y + dy)]
+
+
+def play_scalar(seed, icon_count, moves, width=GRID_WIDTH, height=GRID_HEIGHT):
+    """PuyoEngineで同じ(列, 向き)の並びを遊び、(最後の状態のエンジン, 最大連鎖数)を返す（照合用）"""
+    engine = PuyoEngine(icon_count, width, height, seed=seed)
+    max_chain = 0
+    for column, rotation in moves:
+        if engine.game_over:
+            break
+        engine.current_puyo['position'] = drop_position(engine, column, rotation)
+        engine.lock_puyo()
+        # 消えるアニメーションと連鎖間の遅延を1回ずつで進める
+        while engine.animation_state and not engine.game_over:
+            engine.update(CHAIN_DELAY)
+        # stepを使わないので、溜まったイベントはここで読んで捨てる
+        for event in engine.events:
+            if event['type'] == "chain":
+                max_chain = max(max_chain, event['chain_count'])
+        engine.events = []
+    return engine, max_chain
+
+
+def verify(icon_count, games, placements, seed=0):
+    """ランダムな配置でバッチとPuyoEngineを比べ（得点、最大連鎖数、ゲームオーバー、盤面）、一致しなかったゲーム数を返す"""
+    seeds = [seed + i for i in range(games)]
+    batch = BatchEngine(seeds, icon_count)
+    rng = np.random.default_rng(seed)
+    moves = [[] for _ in range(games)]
+    for _ in range(placements):
+        columns, rotations = batch.random_moves(rng)
+        for i in np.flatnonzero(~batch.game_over):
+            moves[i].append((int(columns[i]), int(rotations[i])))
+        batch.place(columns, rotations)
+
+    mismatches = 0
+    for i, game_seed in enumerate(seeds):
+        engine, max_chain = play_scalar(game_seed, icon_count, moves[i])
+        grid = np.array([[EMPTY if icon is None else icon for icon in row] for row in engine.board.to_grid()])
+        if (engine.score != batch.scores[i] or max_chain != batch.max_chains[i]
+                or engine.game_over != batch.game_over[i]
+                or not np.array_equal(grid, batch.boards[i])):
+            mismatches += 1
+    return mismatches
+
+
+def run_random(icon_count, games, placements, seed=0):
+    """ランダムに配置してゲームを進め、(エンジン, 配置した回数, かかった秒数)を返す"""
+    batch = BatchEngine([seed + i for i in range(games)], icon_count)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    for _ in range(placements):
+        if batch.game_over.all():
+            break
+        batch.place(*batch.random_moves(rng))
+    elapsed = time.perf_counter() - start
+    return batch, int(batch.placements.sum()), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ランダムな配置で大量のゲームをまとめて進める")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--placements", type=int, default=200, help="1ゲームあたりの最大配置数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verify", type=int, default=200, help="PuyoEngineと照合するゲーム数（0で照合しない）")
+    args = parser.parse_args()
+
+    for difficulty, icon_count in DIFFICULTY_LEVELS.items():
+        if args.verify:
+            mismatches = verify(icon_count, args.verify, args.placements, args.seed)
+            print(f"{difficulty}: PuyoEngineとの照合 {args.verify}ゲーム中 不一致 {mismatches}")
+
+        batch, placed, elapsed = run_random(icon_count, args.games, args.placements, args.seed)
+        print(f"{difficulty} ({icon_count:2}種類): {args.games}ゲーム {placed:,}配置 {elapsed:.2f}秒 "
+              f"({placed / elapsed:,.0f}配置/秒)  平均スコア {batch.scores.mean():.1f}  "
+              f"最大連鎖 {batch.max_chains.max()}  平均配置数 {batch.placements.mean():.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+ボード処理と描画のベンチマーク
+
+連鎖判定（find_groups）、重力（collapse）、衝突判定（is_valid_position）、
+壁キック付きの回転（rotate_puyo）、画面の描画（draw_board）の時間を測る。
+大きな盤面（LARGE_BOARD_SIZES）では、ロジック更新と描画を合わせた1フレームの時間も測る。
+盤面はシードを固定して作るので、同じ環境なら毎回同じ入力で測れる。
+
+連鎖判定は盤面全体の走査（full=True）と、前回以降に埋まったセルだけを
+調べる差分走査で比べる。盤面は実際のゲーム進行から集めたものも使う。
+描画は毎フレーム全体を描き直す場合と、変わった範囲だけを描き直す場合を比べる。
+
+結果は--outputでJSONに保存でき、--baselineで保存した結果と比べて
+遅くなった項目を表示する（1つでもあれば終了コード1）。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# ディスプレイなしで描画できるようにする
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from engine import (PuyoEngine, DIFFICULTY_LEVELS, GRID_WIDTH, GRID_HEIGHT, MOVE_LEFT, MOVE_RIGHT, SOFT_DROP, ROTATE,
+                    HARD_DROP)
+from board import BOARD_BACKENDS
+
+ACTIONS = [MOVE_LEFT, MOVE_RIGHT, SOFT_DROP, ROTATE]
+
+# 盤面の埋まり具合と、連鎖判定で消えるグループの大きさ
+DENSITIES = [0.25, 0.5, 0.75]
+GROUP_SIZES = [4, 8, 16, 32]
+
+# フレーム時間を測る大きな盤面（幅, 高さ）と、最初に埋めておく高さの割合
+LARGE_BOARD_SIZES = [(64, 128), (256, 512)]
+LARGE_BOARD_FILL = 0.5
+
+# これ以上遅くなったら悪化とみなす割合（--thresholdで変更）
+REGRESSION_THRESHOLD = 0.10
+
+
+def best_time(func, repeat=5):
+    """funcをrepeat回実行して最短の時間（秒）を返す"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def make_board(backend, icon_count, density, seed, width=GRID_WIDTH, height=GRID_HEIGHT):
+    """セルをdensityの確率でランダムに埋めた盤面を作る（浮いているぷよもある）"""
+    rng = random.Random(seed)
+    board = BOARD_BACKENDS[backend](width, height)
+    for y in range(height):
+        for x in range(width):
+            if rng.random() < density:
+                board.set(x, y, rng.randrange(icon_count))
+    return board
+
+
+def make_chain_board(backend, icon_count, group_size, seed, width=GRID_WIDTH, height=GRID_HEIGHT):
+    """
+    下から蛇行しながらgroup_size個のアイコン0をつなげ、残りを下詰めでランダムに埋めた盤面を作る
+
+    アイコン0以外で埋めるので、group_size個のグループが必ず1つできる。
+    """
+    rng = random.Random(seed)
+    board = BOARD_BACKENDS[backend](width, height)
+    group = set()
+    for i in range(min(group_size, width * height)):
+        row, column = divmod(i, width)
+        x = column if row % 2 == 0 else width - 1 - column
+        group.add((x, height - 1 - row))
+
+    for x in range(width):
+        column_height = rng.randint(height // 2, height)
+        for y in range(height - 1, height - 1 - column_height, -1):
+            if (x, y) in group:
+                board.set(x, y, 0)
+            else:
+                board.set(x, y, rng.randrange(1, icon_count))
+    for x, y in group:
+        board.set(x, y, 0)
+    return board
+
+
+def collect_chain_workload(icon_count, games=20, seed=0, board_backend="list"):
+    """ランダムに遊んだゲームから、連鎖判定直前の盤面を集める"""
+    boards = []
+
+    class RecordingEngine(PuyoEngine):
+        def check_chains(self):
+            boards.append(self.board.copy())
+            super().check_chains()
+
+    random.seed(seed)
+    for _ in range(games):
+        engine = RecordingEngine(icon_count, board_backend=board_backend)
+        while not engine.game_over:
+            engine.step(0.1, [random.choice(ACTIONS)])
+    return boards
+
+
+def bench_find_groups(boards, full, repeat=5):
+    """盤面ごとにfind_groupsを実行した平均時間（マイクロ秒）を返す"""
+    best = None
+    for _ in range(repeat):
+        copies = [board.copy() for board in boards]
+        start = time.perf_counter()
+        for board in copies:
+            board.find_groups(4, full=full)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(boards) * 1e6
+
+
+def check_same_groups(boards):
+    """差分走査と全体走査の結果が一致するか確認"""
+    for board in boards:
+        full = board.copy().find_groups(4, full=True)
+        incremental = board.copy().find_groups(4)
+        if sorted(map(sorted, full)) != sorted(map(sorted, incremental)):
+            return False
+    return True
+
+
+def bench_collapse(boards, repeat=5):
+    """盤面ごとにcollapse（浮いているぷよを落とす）を実行した平均時間（マイクロ秒）を返す"""
+    best = None
+    for _ in range(repeat):
+        copies = [board.copy() for board in boards]
+        start = time.perf_counter()
+        for board in copies:
+            board.collapse()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(boards) * 1e6
+
+
+def bench_is_valid_position(board, backend, icon_count, seed, checks=20000, repeat=5):
+    """ランダムな位置のis_valid_positionの平均時間（マイクロ秒）を返す"""
+    rng = random.Random(seed)
+    engine = PuyoEngine(icon_count, board_backend=backend)
+    engine.board = board
+    positions = []
+    for _ in range(checks):
+        x = rng.randrange(-1, engine.width + 1)
+        y = rng.randrange(-1, engine.height + 1)
+        positions.append([(x, y), (x, y + 1)])
+    is_valid_position = engine.is_valid_position
+
+    def run():
+        for position in positions:
+            is_valid_position(position)
+    return best_time(run, repeat) / checks * 1e6
+
+
+def bench_rotate(board, backend, icon_count, rotations=5000, repeat=5):
+    """
+    壁際と積み上がったぷよの横で回転した平均時間（マイクロ秒）を返す
+
+    左右の壁に縦向きで置いたぷよを回すので、壁キックの分岐を通る。
+    """
+    engine = PuyoEngine(icon_count, board_backend=backend)
+    engine.board = board
+    starts = []
+    for x in (0, engine.width - 1):
+        for y in range(engine.height - 1):
+            if engine.is_valid_position([(x, y), (x, y + 1)]):
+                starts.append([(x, y), (x, y + 1)])
+    if not starts:
+        starts.append([(0, -2), (0, -1)])
+    puyo = engine.current_puyo
+
+    def run():
+        for i in range(rotations):
+            puyo['position'] = starts[i % len(starts)]
+            puyo['rotation'] = 0
+            engine.rotate_puyo()
+    return best_time(run, repeat) / rotations * 1e6
+
+
+def bench_renderer(difficulty, full_redraw, frames=2000, seed=0):
+    """ランダムに遊びながら描画し、1フレームあたりの平均描画面積と時間（ミリ秒）を返す"""
+    import main as game_main
+
+    random.seed(seed)
+    game = game_main.PuyoGame(difficulty)
+    game.renderer.full_redraw = full_redraw
+    game.renderer.reset_stats()
+    for _ in range(frames):
+        if game.engine.game_over:
+            game.engine.reset()
+        game.engine.step(1 / game_main.FPS, [random.choice(ACTIONS)])
+        game.draw_board()
+    return game.renderer.stats()
+
+
+def bench_large_board(width, height, backend=None, frames=600, seed=0):
+    """
+    大きな盤面でランダムに遊びながらロジック更新と描画を行い、1フレームの時間のp50とp99（ミリ秒）を返す
+
+    backendを省略するとmain.pyのLARGE_BOARD_BACKENDを使う。
+    各列を高さの半分までランダムに埋めておくので、最初に固定したぷよで大きな連鎖判定が起きる。
+    """
+    import main as game_main
+    from profiler import percentile
+
+    rng = random.Random(seed)
+    saved = game_main.BOARD_SIZE, game_main.LARGE_BOARD_BACKEND
+    game_main.BOARD_SIZE = (width, height)
+    game_main.LARGE_BOARD_BACKEND = backend or game_main.LARGE_BOARD_BACKEND
+    try:
+        game = game_main.PuyoGame("初心者")
+    finally:
+        game_main.BOARD_SIZE, game_main.LARGE_BOARD_BACKEND = saved
+
+    engine = game.engine
+    for x in range(width):
+        for y in range(height - 1, height - 1 - rng.randint(0, int(height * LARGE_BOARD_FILL)), -1):
+            engine.board.set(x, y, rng.randrange(engine.icon_count))
+
+    times = []
+    for _ in range(frames):
+        if engine.game_over:
+            break
+        action = HARD_DROP if rng.random() < 0.05 else rng.choice(ACTIONS)
+        start = time.perf_counter()
+        engine.step(1 / game_main.FPS, [action])
+        game.draw_board()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return percentile(times, 50), percentile(times, 99)
+
+
+def bench_replay(path, backend, repeat=5):
+    """記録したゲームを再実行した1ステップあたりの時間（マイクロ秒）を返す（一致しなければNone）"""
+    from replay import load_replay, verify_replay
+
+    replay = load_replay(path)
+    if not verify_replay(replay, backend)[0]:
+        return None
+    best = min(verify_replay(replay, backend)[2] for _ in range(repeat))
+    return best / max(replay['steps'], 1) * 1e6
+
+
+def run_suite(quick=False, replays=()):
+    """すべてのベンチマークを実行し、{項目名: 時間}の辞書を返す（replaysは負荷に使うリプレイファイル）"""
+    repeat = 3 if quick else 5
+    games = 5 if quick else 20
+    frames = 500 if quick else 2000
+    results = {}
+
+    for backend in BOARD_BACKENDS:
+        for difficulty, icon_count in DIFFICULTY_LEVELS.items():
+            prefix = f"{backend}.icons{icon_count}"
+
+            # 実際のゲーム進行から集めた盤面での連鎖判定
+            boards = collect_chain_workload(icon_count, games=games, board_backend=backend)
+            if not check_same_groups(boards):
+                print(f"{backend} {difficulty}: 差分走査と全体走査の結果が一致しません")
+            full_us = bench_find_groups(boards, full=True, repeat=repeat)
+            incremental_us = bench_find_groups(boards, full=False, repeat=repeat)
+            results[f"find_groups.game.full.{prefix}"] = full_us
+            results[f"find_groups.game.incremental.{prefix}"] = incremental_us
+            print(f"{backend:8} {difficulty} ({icon_count:2}種類) 盤面{len(boards):5}: "
+                  f"全体 {full_us:7.1f}us  差分 {incremental_us:7.1f}us  "
+                  f"x{full_us / incremental_us:4.1f}")
+
+            # 消えるグループの大きさごとの連鎖判定
+            for group_size in GROUP_SIZES:
+                boards = [make_chain_board(backend, icon_count, group_size, seed) for seed in range(50)]
+                results[f"find_groups.group{group_size}.{prefix}"] = bench_find_groups(boards, full=True, repeat=repeat)
+
+            # 埋まり具合ごとの重力、衝突判定、回転
+            for density in DENSITIES:
+                name = f"{prefix}.d{int(density * 100)}"
+                boards = [make_board(backend, icon_count, density, seed) for seed in range(50)]
+                results[f"collapse.{name}"] = bench_collapse(boards, repeat=repeat)
+                settled = boards[0].copy()
+                settled.collapse()
+                results[f"is_valid_position.{name}"] = bench_is_valid_position(settled, backend, icon_count, 0, repeat=repeat)
+                results[f"rotate_puyo.{name}"] = bench_rotate(settled, backend, icon_count, repeat=repeat)
+
+    for difficulty, icon_count in DIFFICULTY_LEVELS.items():
+        full_area, full_ms = bench_renderer(difficulty, full_redraw=True, frames=frames)
+        dirty_area, dirty_ms = bench_renderer(difficulty, full_redraw=False, frames=frames)
+        # 描画はマイクロ秒にそろえる
+        results[f"draw_board.full.icons{icon_count}"] = full_ms * 1000
+        results[f"draw_board.dirty.icons{icon_count}"] = dirty_ms * 1000
+        print(f"描画 {difficulty}: 全体 {full_area:8.0f}px {full_ms:5.2f}ms  "
+              f"差分 {dirty_area:8.0f}px {dirty_ms:5.2f}ms")
+
+    # 大きな盤面でのフレーム時間（ロジック更新 + 描画）
+    for width, height in LARGE_BOARD_SIZES:
+        p50, p99 = bench_large_board(width, height, frames=frames // 2)
+        results[f"frame.{width}x{height}.p50"] = p50 * 1000
+        results[f"frame.{width}x{height}.p99"] = p99 * 1000
+        print(f"大きな盤面 {width}x{height}: 1フレーム p50 {p50:6.2f}ms  p99 {p99:6.2f}ms")
+
+    # 実際に遊んだゲームのリプレイ
+    for path in replays:
+        for backend in BOARD_BACKENDS:
+            step_us = bench_replay(path, backend, repeat=repeat)
+            if step_us is None:
+                print(f"{path}: 再実行の結果が記録と一致しません")
+                continue
+            results[f"replay.{os.path.basename(path)}.{backend}"] = step_us
+            print(f"リプレイ {os.path.basename(path)} {backend}: {step_us:.2f}us/ステップ")
+
+    from text_cache import text_cache
+    stats = text_cache.stats()
+    print(f"文字列キャッシュ: ヒット率 {stats['hit_rate']:.1%} "
+          f"(ヒット {stats['hits']}, ミス {stats['misses']}, 追い出し {stats['evictions']})")
+
+    return results
+
+
+def environment():
+    """結果を比べるときに確認するための実行環境"""
+    import pygame
+    return {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    基準の結果と比べて表示し、threshold以上遅くなった項目名のリストを返す
+
+    どちらか一方にしかない項目は比べない。
+    """
+    regressions = []
+    print(f"{'項目':60} {'基準':>9} {'今回':>9} {'比':>6}")
+    for name in sorted(results.keys() & baseline.keys()):
+        ratio = results[name] / baseline[name] if baseline[name] else 1.0
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  悪化"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = "  改善"
+        print(f"{name:60} {baseline[name]:9.2f} {results[name]:9.2f} {ratio:6.2f}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ボード処理と描画のベンチマーク（時間はマイクロ秒）")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    parser.add_argument("--baseline", help="比べる基準の結果（--outputで書き出したJSON）")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help=f"悪化とみなす遅くなった割合（デフォルト: {REGRESSION_THRESHOLD}）")
+    parser.add_argument("--quick", action="store_true", help="回数を減らして短時間で測る")
+    parser.add_argument("--replay", action="append", default=[],
+                        help="負荷として再実行するリプレイファイル（複数指定可）")
+    args = parser.parse_args()
+
+    results = run_suite(quick=args.quick, replays=args.replay)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'environment': environment(), 'quick': args.quick, 'results': results},
+                      f, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"結果を{args.output}に書き出しました")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != environment():
+            print("注意: 基準の結果とは実行環境が違います")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"{len(regressions)}項目が{args.threshold:.0%}以上遅くなりました")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
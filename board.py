@@ -0,0 +1,402 @@
+"""
+ゲームボードの実装
+
+Board: セルごとのリストで持つ標準の実装
+BitBoard: アイコン種類ごとのビットマスクで持つ実装（衝突・重力・連結判定をビット演算で行う）
+
+どちらも盤面の64ビットのZobristハッシュ（zobrist）を持ち、set、remove、collapseのたびに
+変わったセルの分だけ更新する。セル番号 y * width + x とアイコンから同じ値を作るので、
+同じ内容なら実装によらず同じハッシュになる。
+
+列ごとの高さ（heights、一番上のぷよから盤面の底までの行数）も同じように差分で更新する。
+盤面が下に詰まっていれば、列xで行 height - heights[x] より上はすべて空き。
+"""
+from functools import lru_cache
+
+MASK64 = (1 << 64) - 1
+
+
+@lru_cache(maxsize=None)
+def zobrist_key(index, icon):
+    """セル番号とアイコンの組に対応する64ビットの乱数（splitmix64で作るので表を持たない）"""
+    z = ((index << 16 | icon) * 0x9E3779B97F4A7C15 + 0x9E3779B97F4A7C15) & MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+class Board:
+    """リストのリストでアイコン番号（空きはNone）を持つボード"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.grid = [[None for _ in range(width)] for _ in range(height)]
+        self.zobrist = 0
+        self.heights = [0] * width
+
+        # 前回のfind_groups以降に埋まったセル（連結判定はここからだけ行う）
+        self.dirty = set()
+
+        # 空きができたかもしれない列 -> その一番下の行（それより下は詰まっている。重力はここだけ見る）
+        self.unsettled = {}
+
+    def copy(self):
+        """ボードを複製"""
+        board = Board.__new__(Board)
+        board.width = self.width
+        board.height = self.height
+        board.grid = [row[:] for row in self.grid]
+        board.zobrist = self.zobrist
+        board.heights = self.heights[:]
+        board.dirty = set(self.dirty)
+        board.unsettled = dict(self.unsettled)
+        return board
+
+    def get(self, x, y):
+        """セルのアイコン番号を取得（空きはNone）"""
+        return self.grid[y][x]
+
+    def mark_unsettled(self, x, y):
+        """列xの行yより上に空きがあるかもしれないことを記録"""
+        if self.unsettled.get(x, -1) < y:
+            self.unsettled[x] = y
+
+    def set(self, x, y, icon):
+        """セルにアイコンを置く"""
+        old = self.grid[y][x]
+        if old is not None:
+            self.zobrist ^= zobrist_key(y * self.width + x, old)
+        self.grid[y][x] = icon
+        top = self.height - self.heights[x]
+        if icon is not None:
+            self.zobrist ^= zobrist_key(y * self.width + x, icon)
+            self.dirty.add((x, y))
+            if y < top - 1:
+                # 浮いたぷよ（下に空きがある）
+                self.mark_unsettled(x, top - 1)
+            self.heights[x] = max(self.heights[x], self.height - y)
+        elif old is not None:
+            self.mark_unsettled(x, y)
+            if y == top:
+                self.update_height(x)
+
+    def remove(self, cells):
+        """セルを空にする"""
+        columns = set()
+        for x, y in cells:
+            if 0 <= y < self.height and 0 <= x < self.width:
+                icon = self.grid[y][x]
+                if icon is not None:
+                    self.zobrist ^= zobrist_key(y * self.width + x, icon)
+                    self.grid[y][x] = None
+                    self.mark_unsettled(x, y)
+                    columns.add(x)
+        for x in columns:
+            self.update_height(x)
+
+    def update_height(self, x):
+        """列xの高さを、今の高さの行から下に空きを飛ばして求め直す"""
+        y = self.height - self.heights[x]
+        while y < self.height and self.grid[y][x] is None:
+            y += 1
+        self.heights[x] = self.height - y
+
+    def to_grid(self):
+        """リストのリスト形式に変換"""
+        return [row[:] for row in self.grid]
+
+    def collapse(self):
+        """
+        空きができた列だけを、空きができた一番下の行から上へ1回の走査で下に詰める
+
+        動いたぷよを(列, 元の行, 移動先の行)のリストで返す。
+        """
+        grid = self.grid
+        moves = []
+        for x in sorted(self.unsettled):
+            # 下から見て、次にぷよを置く行（それより下は詰まっている）
+            write = self.unsettled[x]
+            for y in range(write, self.height - self.heights[x] - 1, -1):
+                icon = grid[y][x]
+                if icon is None:
+                    continue
+                if y != write:
+                    grid[write][x] = icon
+                    grid[y][x] = None
+                    self.zobrist ^= zobrist_key(y * self.width + x, icon) ^ zobrist_key(write * self.width + x, icon)
+                    self.dirty.add((x, write))
+                    moves.append((x, y, write))
+                write -= 1
+            self.heights[x] = self.height - 1 - write
+        self.unsettled = {}
+        return moves
+
+    def find_groups(self, min_size=4, full=False):
+        """
+        min_size個以上連結した同じアイコンのグループを返す
+
+        連結成分が変わりうるのは埋まったセルを含む成分だけなので、
+        通常は前回以降に埋まったセルの成分だけを調べる。
+        full=Trueなら盤面全体を走査する（読むだけで、次回調べるセルは変えない）。
+        """
+        if full:
+            seeds = [(x, y) for y in range(self.height) for x in range(self.width)]
+        else:
+            # 埋まったセルを左上から順に調べる
+            seeds = sorted(self.dirty, key=lambda cell: (cell[1], cell[0]))
+
+        # 調べたセル（y * width + x。リストのリストより作るのが速く、大きな盤面でも軽い）
+        visited = bytearray(self.width * self.height)
+        groups = []
+
+        for x, y in seeds:
+            if self.grid[y][x] is not None and not visited[y * self.width + x]:
+                chain = []
+                self.find_chain(x, y, self.grid[y][x], visited, chain)
+                if len(chain) >= min_size:
+                    groups.append(chain)
+
+        # 見つかったグループは消されるまで次回も調べ直す
+        if not full:
+            self.dirty = {cell for chain in groups for cell in chain}
+        return groups
+
+    def find_chain(self, x, y, icon_type, visited, chain):
+        """同じ種類のぷよの連結を探索（スタックを使った深さ優先探索）"""
+        stack = [(x, y)]
+        while stack:
+            x, y = stack.pop()
+
+            # 範囲外チェック
+            if x < 0 or x >= self.width or y < 0 or y >= self.height:
+                continue
+
+            # 既に訪問済みか、異なるタイプのぷよかチェック
+            if visited[y * self.width + x] or self.grid[y][x] != icon_type:
+                continue
+
+            # このぷよを連結に追加
+            visited[y * self.width + x] = 1
+            chain.append((x, y))
+
+            # 4方向を探索
+            stack.append((x - 1, y))
+            stack.append((x, y + 1))
+            stack.append((x + 1, y))
+            stack.append((x, y - 1))
+
+
+class BitBoard:
+    """
+    アイコン種類ごとに1つの整数ビットマスクを持つボード
+
+    セル(x, y)はビット y * width + x に対応する。
+    occupiedは全種類のORで、衝突判定はこの1枚だけで済む。
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.masks = {}
+        self.occupied = 0
+        self.zobrist = 0
+        self.heights = [0] * width
+
+        # 前回のfind_groups以降に埋まったセル（連結判定はここからだけ行う）
+        self.dirty = 0
+
+        # シフト時の折り返しを防ぐためのマスク
+        self.full_mask = (1 << self.size) - 1
+        col0 = 0
+        for y in range(height):
+            col0 |= 1 << (y * width)
+        self.column_bits = col0
+        self.not_first_col = self.full_mask & ~col0
+        self.not_last_col = self.full_mask & ~(col0 << (width - 1))
+
+    def copy(self):
+        """ボードを複製"""
+        board = BitBoard.__new__(BitBoard)
+        board.__dict__.update(self.__dict__)
+        board.masks = dict(self.masks)
+        board.heights = self.heights[:]
+        return board
+
+    def get(self, x, y):
+        """セルのアイコン番号を取得（空きはNone）"""
+        bit = 1 << (y * self.width + x)
+        if not self.occupied & bit:
+            return None
+        for icon, mask in self.masks.items():
+            if mask & bit:
+                return icon
+        return None
+
+    def set(self, x, y, icon):
+        """セルにアイコンを置く（Noneで空にする）"""
+        index = y * self.width + x
+        bit = 1 << index
+        if self.occupied & bit:
+            for key in self.masks:
+                if self.masks[key] & bit:
+                    self.zobrist ^= zobrist_key(index, key)
+                    self.masks[key] &= ~bit
+            self.occupied &= ~bit
+        if icon is not None:
+            self.zobrist ^= zobrist_key(index, icon)
+            self.masks[icon] = self.masks.get(icon, 0) | bit
+            self.occupied |= bit
+            self.dirty |= bit
+            self.heights[x] = max(self.heights[x], self.height - y)
+        elif self.height - y == self.heights[x]:
+            self.update_height(x)
+
+    def remove(self, cells):
+        """セルを空にする"""
+        clear = 0
+        columns = set()
+        for x, y in cells:
+            if 0 <= y < self.height and 0 <= x < self.width:
+                clear |= 1 << (y * self.width + x)
+                columns.add(x)
+        keep = ~clear
+        for key, mask in self.masks.items():
+            removed = mask & clear
+            while removed:
+                low = removed & -removed
+                self.zobrist ^= zobrist_key(low.bit_length() - 1, key)
+                removed ^= low
+            self.masks[key] = mask & keep
+        self.occupied &= keep
+        for x in columns:
+            self.update_height(x)
+
+    def update_height(self, x):
+        """列xの高さを、列の一番上のぷよの位置から求め直す"""
+        column = (self.occupied >> x) & self.column_bits
+        if column:
+            self.heights[x] = self.height - ((column & -column).bit_length() - 1) // self.width
+        else:
+            self.heights[x] = 0
+
+    def to_grid(self):
+        """リストのリスト形式に変換"""
+        grid = [[None for _ in range(self.width)] for _ in range(self.height)]
+        for icon, mask in self.masks.items():
+            for x, y in self.cells(mask):
+                grid[y][x] = icon
+        return grid
+
+    def cells(self, mask):
+        """マスクに含まれるセルの座標を行優先で返す"""
+        result = []
+        while mask:
+            low = mask & -mask
+            index = low.bit_length() - 1
+            result.append((index % self.width, index // self.width))
+            mask ^= low
+        return result
+
+    def below_gap(self):
+        """下に空きがあるセルのマスク（列内で下方向へ空きを伝播させる）"""
+        gaps = (self.full_mask & ~self.occupied) >> self.width
+        shift = self.width
+        while shift < self.size:
+            gaps |= gaps >> shift
+            shift *= 2
+        return gaps & self.occupied
+
+    def collapse(self):
+        """
+        各列を1回で下に詰める
+
+        動いたぷよを(列, 元の行, 移動先の行)のリストで返す。
+        """
+        floating = self.below_gap()
+        if not floating:
+            return []
+
+        # 浮いているセルごとの落下距離（同じ列でそれより下にある空きの数）
+        empty = self.full_mask & ~self.occupied
+        drops = {}
+        moves = []
+        for x, y in self.cells(floating):
+            below = empty >> ((y + 1) * self.width + x)
+            distance = (below & self.column_bits).bit_count()
+            drops[1 << (y * self.width + x)] = distance * self.width
+            moves.append((x, y, y + distance))
+
+        # 種類ごとに浮いているセルだけを移動させる
+        landed = 0
+        for key, mask in self.masks.items():
+            moving = mask & floating
+            if not moving:
+                continue
+            mask &= ~floating
+            while moving:
+                bit = moving & -moving
+                index = bit.bit_length() - 1
+                self.zobrist ^= zobrist_key(index, key) ^ zobrist_key(index + drops[bit], key)
+                landed |= bit << drops[bit]
+                mask |= bit << drops[bit]
+                moving ^= bit
+            self.masks[key] = mask
+        self.occupied = (self.occupied & ~floating) | landed
+        self.dirty |= landed
+        for x in {move[0] for move in moves}:
+            self.update_height(x)
+
+        # 各列を下から順に並べる
+        moves.sort(key=lambda move: (move[0], -move[1]))
+        return moves
+
+    def flood(self, seed, mask):
+        """seedからmask内で4方向に連結している領域を返す"""
+        region = seed
+        while True:
+            grown = (region
+                     | ((region << 1) & self.not_first_col)
+                     | ((region >> 1) & self.not_last_col)
+                     | (region << self.width)
+                     | (region >> self.width)) & mask
+            if grown == region:
+                return region
+            region = grown
+
+    def find_groups(self, min_size=4, full=False):
+        """
+        min_size個以上連結した同じアイコンのグループを返す
+
+        通常は埋まったセルの成分だけ調べる。full=Trueなら盤面全体を走査する（次回調べるセルは変えない）。
+        """
+        seeds_mask = self.occupied if full else self.dirty
+        found = []
+        for mask in self.masks.values():
+            # そもそも個数が足りない種類は調べない
+            if mask.bit_count() < min_size:
+                continue
+            seeds = mask & seeds_mask
+            while seeds:
+                seed = seeds & -seeds
+                region = self.flood(seed, mask)
+                seeds &= ~region
+                if region.bit_count() >= min_size:
+                    found.append(region)
+
+        # 見つかったグループは消されるまで次回も調べ直す
+        if not full:
+            self.dirty = 0
+            for region in found:
+                self.dirty |= region
+
+        # 通常ボードと同じく、左上から走査した順に並べる
+        found.sort(key=lambda region: region & -region)
+        return [self.cells(region) for region in found]
+
+
+BOARD_BACKENDS = {
+    "list": Board,
+    "bitboard": BitBoard,
+}
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+先読みボット
+
+今のぷよを置ける最終位置をすべて列挙し（PuyoEngine.enumerate_placements）、
+置いたあとの連鎖を最後までシミュレーションして盤面を評価する。
+次のぷよまでの2手を読み、同じ盤面に同じぷよを置いた結果は覚えておいて使い回す。
+盤面はZobristハッシュで区別し、連鎖の結果もCascadeCacheで使い回す。
+1手に使う時間には上限があり、超えたらそこまでで一番良い手を選ぶ。
+"""
+import argparse
+import time
+
+from engine import (PuyoEngine, CascadeCache, DIFFICULTY_LEVELS, GRID_WIDTH, GRID_HEIGHT, ACTION_MOVES, ROTATE,
+                    SOFT_DROP, HARD_DROP, resolve_cascade)
+
+# 1手の思考時間の上限（秒）
+BOT_TIME_BUDGET = 0.05
+
+# 覚えておく結果の上限（超えたら捨てる）
+MEMO_MAX_ENTRIES = 200000
+
+# 評価の重み
+CONNECTION_WEIGHT = 2  # 同じアイコンが2〜3個つながっている（連鎖の種）
+HEIGHT_WEIGHT = 1  # 積み上がった高さ（2乗で効く）
+DEATH_VALUE = -10 ** 9  # ゲームオーバー
+
+# オートプレイで次のアクションを出すまでのロジック更新回数
+AUTOPLAY_INTERVAL = 6
+
+
+def settle(board, position, icons, cascade_cache=None):
+    """
+    ぷよを置いて連鎖を最後まで進める（boardは書き換えない）
+
+    (置いたあとの盤面, 得点, 連鎖数)を返す。得点はPuyoEngineと同じ計算。
+    cascade_cacheを使う場合、返す盤面はキャッシュと共有なので書き換えないこと。
+    """
+    board = board.copy()
+    for (x, y), icon in zip(position, icons):
+        if 0 <= y < board.height and 0 <= x < board.width:
+            board.set(x, y, icon)
+    board.collapse()
+
+    if cascade_cache is None:
+        outcome = resolve_cascade(board)
+    else:
+        outcome = cascade_cache.resolve(board)
+    return outcome['board'], outcome['score'], outcome['chains']
+
+
+def evaluate(board, spawn):
+    """盤面の良さ（つながりが多く、低いほど良い。出現位置がふさがっていればゲームオーバー）"""
+    for x, y in spawn:
+        if board.get(x, y) is not None:
+            return DEATH_VALUE
+
+    value = 0
+    for group in board.find_groups(2, full=True):
+        value += CONNECTION_WEIGHT * len(group) ** 2
+
+    # 列ごとの高さ（ボードが置く、消す、落とすたびに更新している）
+    for column_height in board.heights:
+        value -= HEIGHT_WEIGHT * column_height ** 2
+    return value
+
+
+class Bot:
+    def __init__(self, icon_count, width=GRID_WIDTH, height=GRID_HEIGHT, board_backend="list",
+                 time_budget=BOT_TIME_BUDGET):
+        self.time_budget = time_budget
+        # 仮の盤面で置き場所を列挙するためのエンジン
+        self.scratch = PuyoEngine(icon_count, width, height, board_backend=board_backend)
+        self.spawn = tuple(self.scratch.spawn_position())
+
+        # (盤面のハッシュ, 位置, アイコン) -> 置いた結果 と、盤面のハッシュ -> 置き場所
+        self.results = {}
+        self.placements = {}
+        self.cascade_cache = CascadeCache()
+
+        # 統計
+        self.nodes = 0  # 評価した局面の数（覚えていた結果を使った分も含む）
+        self.memo_hits = 0
+        self.search_time = 0.0
+        self.decisions = 0
+        self.timeouts = 0
+
+    def placements_from_spawn(self, board, board_key):
+        """仮の盤面で、出現位置から置ける最終位置を返す"""
+        placements = self.placements.get(board_key)
+        if placements is None:
+            self.scratch.board = board
+            placements = list(self.scratch.enumerate_placements(self.spawn))
+            if len(self.placements) >= MEMO_MAX_ENTRIES:
+                self.placements.clear()
+            self.placements[board_key] = placements
+        return placements
+
+    def place(self, board, board_key, position, icons):
+        """置いたあとの(盤面, 盤面のキー, 評価値, 得点)を返す（評価値は得点+盤面の良さ）"""
+        self.nodes += 1
+        key = (board_key, position, icons)
+        result = self.results.get(key)
+        if result is not None:
+            self.memo_hits += 1
+            return result
+
+        settled, score, _ = settle(board, position, icons, self.cascade_cache)
+        value = evaluate(settled, self.spawn)
+        if value != DEATH_VALUE:
+            value += score
+        result = (settled, settled.zobrist, value, score)
+        if len(self.results) >= MEMO_MAX_ENTRIES:
+            self.results.clear()
+        self.results[key] = result
+        return result
+
+    def choose(self, engine):
+        """
+        今のぷよの置き場所を選び、(最終位置, そこまでのアクションのリスト)を返す
+
+        まず1手目だけで評価して良い順に並べ、時間が許す限り次のぷよまで読んで選び直す。
+        """
+        start = time.perf_counter()
+        deadline = start + self.time_budget
+        board = engine.board
+        board_key = board.zobrist
+        icons = tuple(engine.current_puyo['icons'])
+
+        candidates = []
+        for position, path in engine.enumerate_placements().items():
+            settled, settled_key, value, score = self.place(board, board_key, position, icons)
+            candidates.append((value, position, path, settled, settled_key, score))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        best_value, best_position, best_path = candidates[0][:3]
+
+        if engine.next_puyo is not None:
+            next_icons = tuple(engine.next_puyo['icons'])
+            best_value = DEATH_VALUE - 1
+            for value, position, path, settled, settled_key, score in candidates:
+                if time.perf_counter() > deadline:
+                    self.timeouts += 1
+                    break
+                if value == DEATH_VALUE:
+                    continue
+                second = DEATH_VALUE
+                for next_position in self.placements_from_spawn(settled, settled_key):
+                    second = max(second, self.place(settled, settled_key, next_position, next_icons)[2])
+                # 1手目の盤面の良さは2手目の評価値に含まれるので、得点だけを足す
+                total = score + second if second != DEATH_VALUE else DEATH_VALUE
+                if total > best_value:
+                    best_value, best_position, best_path = total, position, path
+
+        self.decisions += 1
+        self.search_time += time.perf_counter() - start
+        return best_position, best_path
+
+    def stats(self):
+        """1手あたりの平均思考時間（ミリ秒）、評価した局面数/秒、結果の再利用率、時間切れの回数を返す"""
+        if not self.decisions:
+            return 0.0, 0.0, 0.0, 0
+        return (self.search_time / self.decisions * 1000,
+                self.nodes / self.search_time if self.search_time else 0.0,
+                self.memo_hits / self.nodes if self.nodes else 0.0,
+                self.timeouts)
+
+
+class AutoPlayer:
+    """Botが選んだ置き場所まで、ロジック更新ごとにアクションを出す"""
+
+    def __init__(self, bot, interval=AUTOPLAY_INTERVAL):
+        self.bot = bot
+        self.interval = interval
+        self.puyo = None
+        self.target = None
+        self.path = []  # 置き場所までの残りのアクション
+        self.expected = None  # 最後にアクションを出したあとの位置
+        self.wait = 0
+
+    def next_actions(self, engine):
+        """次のロジック更新で適用するアクションのリストを返す"""
+        if engine.game_over or engine.animation_state or not engine.current_puyo:
+            return []
+
+        # 新しいぷよが出たら置き場所を決める
+        position = tuple(engine.current_puyo['position'])
+        if engine.current_puyo is not self.puyo:
+            self.puyo = engine.current_puyo
+            self.target, self.path = self.bot.choose(engine)
+            self.expected = position
+            self.wait = 0
+
+        if self.wait > 0:
+            self.wait -= 1
+            return []
+        self.wait = self.interval
+
+        # 自動落下などで思った位置にいなければ、今の位置から道筋をたどり直す
+        if position != self.expected:
+            self.path = engine.enumerate_placements().get(self.target)
+            if self.path is None:
+                # 落ちてしまって届かなくなったら選び直す
+                self.target, self.path = self.bot.choose(engine)
+        if not self.path:
+            self.expected = position
+            return []
+
+        # 残りが下移動だけなら一気に落とす（まっすぐ落ちて止まる位置は同じ）
+        if all(action == SOFT_DROP for action in self.path):
+            self.path = []
+            return [HARD_DROP]
+
+        action = self.path.pop(0)
+        if action == ROTATE:
+            self.expected = tuple(engine.rotated_position(position))
+        else:
+            dx, dy = ACTION_MOVES[action]
+            self.expected = tuple((x + dx, y + dy) for x, y in position)
+        return [action]
+
+
+def play_game(icon_count, seed, time_budget=BOT_TIME_BUDGET, board_backend="bitboard", max_steps=200000):
+    """ディスプレイなしでボットに1ゲーム遊ばせ、(エンジン, ボット)を返す"""
+    engine = PuyoEngine(icon_count, board_backend=board_backend, seed=seed)
+    bot = Bot(icon_count, engine.width, engine.height, board_backend, time_budget)
+    player = AutoPlayer(bot, interval=0)
+    while not engine.game_over and engine.steps < max_steps:
+        engine.step(1 / 120, player.next_actions(engine))
+    return engine, bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ボットにディスプレイなしで遊ばせる")
+    parser.add_argument("--difficulty", default="初心者", choices=list(DIFFICULTY_LEVELS))
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget", type=float, default=BOT_TIME_BUDGET, help="1手の思考時間の上限（秒）")
+    parser.add_argument("--max-steps", type=int, default=200000, help="1ゲームの最大ステップ数")
+    args = parser.parse_args()
+
+    icon_count = DIFFICULTY_LEVELS[args.difficulty]
+    for i in range(args.games):
+        engine, bot = play_game(icon_count, args.seed + i, args.budget, max_steps=args.max_steps)
+        think_ms, nodes_per_second, hit_rate, timeouts = bot.stats()
+        cascade_hit_rate = bot.cascade_cache.stats()[2]
+        print(f"シード {args.seed + i}: スコア {engine.score}  {bot.decisions}手  "
+              f"思考 {think_ms:.1f}ms/手  {nodes_per_second:,.0f}局面/秒  "
+              f"再利用 {hit_rate:.0%}  連鎖キャッシュ {cascade_hit_rate:.0%}  時間切れ {timeouts}回"
+              f"{'' if engine.game_over else '（打ち切り）'}")
+
+
+if __name__ == "__main__":
+    main()
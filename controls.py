@@ -0,0 +1,117 @@
+"""
+キー入力
+
+押しっぱなしの左右移動と下移動は、DAS（最初のリピートまでの待ち時間）のあと
+ARR（リピート間隔）ごとに繰り返す。アクションには入力された時刻を付けて返すので、
+ゲームループはその時刻を含むロジック更新で適用できる。
+入力してから画面に反映されるまでの時間（入力遅延）も測る。
+"""
+import time
+from collections import deque
+
+import pygame
+
+from engine import MOVE_LEFT, MOVE_RIGHT, SOFT_DROP, ROTATE, HARD_DROP
+
+# キーリピートの設定（秒）
+DAS = 0.15  # 押してから最初のリピートまで
+ARR = 0.05  # 左右移動のリピート間隔
+SOFT_DROP_ARR = 0.03  # 下移動のリピート間隔
+
+# 描画が詰まったときに1回のpollで追いつくリピートの最大数（キーごと）
+MAX_REPEATS_PER_POLL = 4
+
+# 入力遅延を覚えておく件数
+LATENCY_SAMPLES = 600
+
+# キーとアクションの対応
+KEY_ACTIONS = {
+    pygame.K_LEFT: MOVE_LEFT,
+    pygame.K_RIGHT: MOVE_RIGHT,
+    pygame.K_DOWN: SOFT_DROP,
+    pygame.K_UP: ROTATE,
+    pygame.K_SPACE: ROTATE,
+    pygame.K_x: HARD_DROP,
+}
+
+# 左右は後から押した方だけをリピートする
+HORIZONTAL_ACTIONS = (MOVE_LEFT, MOVE_RIGHT)
+
+
+class InputHandler:
+    def __init__(self, das=DAS, arr=ARR, soft_drop_arr=SOFT_DROP_ARR):
+        self.das = das
+        self.repeat_intervals = {MOVE_LEFT: arr, MOVE_RIGHT: arr, SOFT_DROP: soft_drop_arr}
+        self.held = {}  # 押しっぱなしのキー -> 次にリピートする時刻
+        self.actions = []  # まだ返していない(時刻, アクション)
+        self.applied = []  # ロジックに適用済みで、まだ画面に出していない入力の時刻
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def reset(self):
+        """押しっぱなしの状態と溜まった入力を捨てる（ポーズやリスタート時）"""
+        self.held.clear()
+        self.actions = []
+        self.applied = []
+
+    def key_down(self, key, timestamp=None):
+        """キーが押された。ゲームのアクションに対応するキーならTrueを返す"""
+        action = KEY_ACTIONS.get(key)
+        if action is None:
+            return False
+        if timestamp is None:
+            timestamp = time.perf_counter()
+
+        self.actions.append((timestamp, action))
+        if action in self.repeat_intervals:
+            if action in HORIZONTAL_ACTIONS:
+                for other in [k for k in self.held if KEY_ACTIONS[k] in HORIZONTAL_ACTIONS]:
+                    del self.held[other]
+            self.held[key] = timestamp + self.das
+        return True
+
+    def key_up(self, key):
+        """キーが離された"""
+        self.held.pop(key, None)
+
+    def poll(self, now=None):
+        """押しっぱなしのキーのリピートを発生させ、溜まった(時刻, アクション)を時刻順に返す"""
+        if now is None:
+            now = time.perf_counter()
+
+        # KEYUPを取りこぼしても（ウィンドウ外で離した場合など）止まるように、キーの状態を直接見る
+        pressed = pygame.key.get_pressed()
+        for key in list(self.held):
+            if not pressed[key]:
+                del self.held[key]
+                continue
+            action = KEY_ACTIONS[key]
+            interval = self.repeat_intervals[action]
+            # 追いつけないほど遅れていたら古いリピートは捨てる
+            self.held[key] = max(self.held[key], now - interval * MAX_REPEATS_PER_POLL)
+            while self.held[key] <= now:
+                self.actions.append((self.held[key], action))
+                self.held[key] += interval
+
+        actions = sorted(self.actions, key=lambda item: item[0])
+        self.actions = []
+        return actions
+
+    def mark_applied(self, timestamp):
+        """入力をロジックに適用した（次に画面を更新したときに遅延を記録する）"""
+        self.applied.append(timestamp)
+
+    def mark_presented(self, now=None):
+        """画面を更新した。適用済みの入力の遅延を記録する"""
+        if not self.applied:
+            return
+        if now is None:
+            now = time.perf_counter()
+        self.latencies.extend(now - timestamp for timestamp in self.applied)
+        self.applied = []
+
+    def latency_stats(self):
+        """直近の入力遅延の件数、平均（ミリ秒）、最大（ミリ秒）を返す"""
+        if not self.latencies:
+            return 0, 0.0, 0.0
+        count = len(self.latencies)
+        return count, sum(self.latencies) / count * 1000, max(self.latencies) * 1000
@@ -0,0 +1,470 @@
+"""
+ゲームルールのエンジン（pygameに依存しない）
+
+PuyoGameは描画と入力だけを担当し、ルールはすべてここで処理する。
+ディスプレイなしで動くので、CIやオフライン分析で大量のゲームを高速に回せる。
+"""
+import random
+from collections import deque
+
+from board import BOARD_BACKENDS
+
+# ボード設定
+GRID_WIDTH = 6
+GRID_HEIGHT = 12
+
+# 難易度レベル設定
+DIFFICULTY_LEVELS = {
+    "初心者": 4,
+    "中級者": 6,
+    "上級者": 20
+}
+
+# アニメーション設定
+CHAIN_DELAY = 0.5  # 連鎖間の遅延（秒）
+VANISH_DURATION = 0.3  # 消える時のアニメーション時間（秒）
+FALL_DURATION = 0.2  # 消えた後にぷよが落ちるアニメーション時間（秒、連鎖間の遅延に含まれる）
+
+# アクション
+MOVE_LEFT = "left"
+MOVE_RIGHT = "right"
+SOFT_DROP = "down"
+ROTATE = "rotate"
+HARD_DROP = "hard_drop"
+
+ACTION_MOVES = {
+    MOVE_LEFT: (-1, 0),
+    MOVE_RIGHT: (1, 0),
+    SOFT_DROP: (0, 1),
+}
+
+# 壁キック（壁際で回転できない場合に試すずらし方、順に試す）
+KICK_OFFSETS = [(-1, 0), (1, 0), (0, -1)]
+
+# 連鎖の結果を覚えておく盤面の数
+CASCADE_CACHE_SIZE = 50000
+
+
+def resolve_cascade(board):
+    """
+    連鎖を最後まで進めた結果を返す（boardは書き換えない）
+
+    {'board': 連鎖後の盤面, 'chains': 連鎖数, 'score': 得点, 'steps': 連鎖ごとに消えたグループのリスト}
+    """
+    board = board.copy()
+    steps = []
+    score = 0
+    while True:
+        groups = board.find_groups(4)
+        if not groups:
+            return {'board': board, 'chains': len(steps), 'score': score, 'steps': steps}
+        steps.append(groups)
+        for group in groups:
+            score += len(group) * 10
+            board.remove(group)
+        board.collapse()
+
+
+class CascadeCache:
+    """
+    連鎖前の盤面のハッシュから連鎖の結果を引くキャッシュ
+
+    連鎖は盤面の内容だけで決まるので、同じ盤面なら前の結果をそのまま使える。
+    いっぱいになったら古いものから捨てる。返した結果の盤面は共有なので書き換えないこと。
+    """
+
+    def __init__(self, max_entries=CASCADE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.outcomes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, board):
+        """resolve_cascadeと同じ結果を返す（覚えていればそれを使う）"""
+        key = (type(board), board.width, board.height, board.zobrist)
+        outcome = self.outcomes.get(key)
+        if outcome is not None:
+            self.hits += 1
+            return outcome
+
+        self.misses += 1
+        outcome = resolve_cascade(board)
+        if self.max_entries > 0:
+            if len(self.outcomes) >= self.max_entries:
+                # dictは入れた順なので先頭が一番古い
+                del self.outcomes[next(iter(self.outcomes))]
+            self.outcomes[key] = outcome
+        return outcome
+
+    def stats(self):
+        """(ヒット数, ミス数, ヒット率, 覚えている数)を返す"""
+        total = self.hits + self.misses
+        return self.hits, self.misses, self.hits / total if total else 0.0, len(self.outcomes)
+
+
+class PuyoEngine:
+    def __init__(self, icon_count, width=GRID_WIDTH, height=GRID_HEIGHT, board_backend="list", seed=None,
+                 cascade_cache=None):
+        self.icon_count = icon_count
+        self.width = width
+        self.height = height
+        self.board_class = BOARD_BACKENDS[board_backend]
+        # 指定すると、連鎖で消えるグループをキャッシュから引く（結果は同じ）
+        self.cascade_cache = cascade_cache
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """
+        ゲーム状態を初期化
+
+        ぷよの並びはゲームごとの乱数で決まるので、同じseedと同じ入力なら同じゲームになる。
+        seedを省略するとグローバルなrandomから新しいシードを選ぶ。
+        """
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        # 進めたステップ数（リプレイで入力のタイミングを表す）
+        self.steps = 0
+
+        # ゲームボード初期化
+        self.board = self.board_class(self.width, self.height)
+
+        # 現在のぷよ
+        self.current_puyo = self.create_new_puyo()
+        self.next_puyo = self.create_new_puyo()
+
+        # ゲーム状態
+        self.game_over = False
+        self.score = 0
+        self.fall_time = 0
+        self.fall_speed = 0.5  # 秒単位
+
+        # アニメーション状態
+        self.animation_state = None  # None, "checking", "vanishing", "delay"
+        self.animation_time = 0
+        self.vanishing_puyos = []
+        self.falling_moves = []  # 直近の落下（列, 元の行, 移動先の行）
+        self.chain_count = 0
+        self.cascade_steps = None  # キャッシュから引いた、連鎖ごとに消えるグループ
+
+        # 直近のステップで発生したイベント
+        self.events = []
+
+    def emit(self, event_type, **data):
+        """イベントを記録"""
+        data['type'] = event_type
+        self.events.append(data)
+
+    def step(self, dt, actions=()):
+        """アクションを適用してdt秒進め、発生したイベントのリストを返す"""
+        for action in actions:
+            if self.apply_action(action):
+                self.emit("action", action=action)
+        self.update(dt)
+        self.steps += 1
+
+        events = self.events
+        self.events = []
+        return events
+
+    def apply_action(self, action):
+        """アクションを1つ適用"""
+        if action == ROTATE:
+            return self.rotate_puyo()
+        if action == HARD_DROP:
+            return self.hard_drop()
+        dx, dy = ACTION_MOVES[action]
+        return self.move_puyo(dx, dy)
+
+    def create_new_puyo(self):
+        """新しいぷよを作成"""
+        if self.icon_count < 2:
+            return None
+
+        # ランダムに2つのアイコンを選択
+        icon1 = self.rng.randint(0, self.icon_count - 1)
+        icon2 = self.rng.randint(0, self.icon_count - 1)
+
+        return {
+            'position': self.spawn_position(),
+            'icons': [icon1, icon2],
+            'rotation': 0
+        }
+
+    def spawn_position(self):
+        """新しいぷよの初期位置"""
+        x = self.width // 2 - 1
+        return [(x, 0), (x, 1)]
+
+    def move_puyo(self, dx=0, dy=0):
+        """ぷよを移動"""
+        if self.game_over or not self.current_puyo or self.animation_state:
+            return False
+
+        # 移動後の位置を計算
+        new_positions = [(x + dx, y + dy) for x, y in self.current_puyo['position']]
+
+        # 移動が有効かチェック
+        if self.is_valid_position(new_positions):
+            self.current_puyo['position'] = new_positions
+            return True
+        return False
+
+    def drop_distance(self, positions):
+        """positionsのぷよをまっすぐ落としたとき、止まるまでに落ちる行数（列の高さだけで求める）"""
+        heights = self.board.heights
+        return max(0, min(self.height - heights[x] - 1 - y for x, y in positions))
+
+    def landing_cells(self, positions):
+        """
+        positionsのぷよを落として固定し、ちぎれた片方も落ちたあとのセルを返す（ゴースト表示用）
+
+        順番はpositionsと同じ。盤面より上で止まって置かれないセルはyが負になる。
+        """
+        distance = self.drop_distance(positions)
+        landed = [(x, y + distance) for x, y in positions]
+        heights = list(self.board.heights)
+        # 置かれたぷよを下から順に、その列の一番上に積む
+        for i in sorted(range(len(landed)), key=lambda i: -landed[i][1]):
+            x, y = landed[i]
+            if y >= 0:
+                heights[x] += 1
+                landed[i] = (x, self.height - heights[x])
+        return landed
+
+    def hard_drop(self):
+        """ぷよを一気に落としてその場で固定"""
+        if self.game_over or not self.current_puyo or self.animation_state:
+            return False
+
+        distance = self.drop_distance(self.current_puyo['position'])
+        self.current_puyo['position'] = [(x, y + distance) for x, y in self.current_puyo['position']]
+        self.fall_time = 0
+        self.lock_puyo()
+        return True
+
+    def rotate_puyo(self):
+        """ぷよを回転"""
+        if self.game_over or not self.current_puyo or self.animation_state:
+            return False
+
+        new_positions = self.rotated_position(self.current_puyo['position'])
+        if new_positions is None:
+            return False
+
+        self.current_puyo['position'] = new_positions
+        self.current_puyo['rotation'] = (self.current_puyo['rotation'] + 1) % 4
+        return True
+
+    def rotated_position(self, positions, is_valid=None):
+        """
+        時計回りに回転した位置を返す（壁キック込み。回転できなければNone）
+
+        is_validを渡すと、is_valid_positionの代わりにそれで判定する。
+        """
+        if is_valid is None:
+            is_valid = self.is_valid_position
+
+        # 回転の中心を取得
+        center_x, center_y = positions[0]
+
+        # 2つ目のぷよの相対位置を計算
+        x2, y2 = positions[1]
+        rel_x, rel_y = x2 - center_x, y2 - center_y
+
+        # 時計回りに90度回転
+        new_rel_x, new_rel_y = -rel_y, rel_x
+
+        # 新しい位置を計算
+        new_positions = [(center_x, center_y), (center_x + new_rel_x, center_y + new_rel_y)]
+
+        # 回転が有効かチェック
+        if is_valid(new_positions):
+            return new_positions
+
+        # 壁キック処理（壁際で回転できない場合、少し横にずらす）
+        for offset_x, offset_y in KICK_OFFSETS:
+            kicked_positions = [(pos[0] + offset_x, pos[1] + offset_y) for pos in new_positions]
+            if is_valid(kicked_positions):
+                return kicked_positions
+
+        return None
+
+    def enumerate_placements(self, positions=None):
+        """
+        今のぷよ（positionsを指定すればその位置から）を置ける最終位置をすべて返す
+
+        左右移動、下移動、回転（壁キック込み）でたどれる位置のうち、それ以上下に
+        動けない位置を{最終位置: そこまでのアクションのリスト}の辞書で返す。
+        最終位置は2つのぷよの座標のタプルで、順番はcurrent_puyo['icons']と同じ。
+        """
+        if positions is None:
+            positions = self.current_puyo['position']
+
+        # is_valid_positionと同じ判定（列の高さより上は調べずに空きとみなす）
+        get = self.board.get
+        width, height = self.width, self.height
+        tops = [height - column_height for column_height in self.board.heights]
+
+        def is_valid(position):
+            for x, y in position:
+                if x < 0 or x >= width or y >= height:
+                    return False
+                if y >= tops[x] and get(x, y) is not None:
+                    return False
+            return True
+
+        start = tuple(positions)
+        paths = {start: []}
+        queue = deque([start])
+        placements = {}
+        while queue:
+            position = queue.popleft()
+            for action in (MOVE_LEFT, MOVE_RIGHT, ROTATE, SOFT_DROP):
+                if action == ROTATE:
+                    moved = self.rotated_position(position, is_valid)
+                else:
+                    dx, dy = ACTION_MOVES[action]
+                    moved = [(x + dx, y + dy) for x, y in position]
+                    if not is_valid(moved):
+                        moved = None
+
+                if moved is None:
+                    # 下に動けなければここで固定される
+                    if action == SOFT_DROP:
+                        placements[position] = paths[position]
+                    continue
+                moved = tuple(moved)
+                if moved not in paths:
+                    paths[moved] = paths[position] + [action]
+                    queue.append(moved)
+        return placements
+
+    def is_valid_position(self, positions):
+        """指定された位置が有効かどうかをチェック"""
+        heights = self.board.heights
+        for x, y in positions:
+            # 画面外チェック
+            if x < 0 or x >= self.width or y >= self.height:
+                return False
+
+            # 他のぷよとの衝突チェック（列の高さより上は空き）
+            if y >= self.height - heights[x] and self.board.get(x, y) is not None:
+                return False
+
+        return True
+
+    def lock_puyo(self):
+        """現在のぷよをボードに固定"""
+        for i, (x, y) in enumerate(self.current_puyo['position']):
+            if 0 <= y < self.height and 0 <= x < self.width:
+                self.board.set(x, y, self.current_puyo['icons'][i])
+        self.emit("lock", positions=list(self.current_puyo['position']), icons=list(self.current_puyo['icons']))
+
+        # 浮いているぷよを落とす（ちぎれた片方など）
+        self.apply_gravity()
+
+        # 連鎖チェック
+        self.chain_count = 0
+        self.start_chain_check()
+
+        # 次のぷよを取得
+        self.current_puyo = self.next_puyo
+        self.next_puyo = self.create_new_puyo()
+
+        # ゲームオーバーチェック
+        heights = self.board.heights
+        for x, y in self.current_puyo['position']:
+            if y >= self.height - heights[x] and self.board.get(x, y) is not None:
+                self.game_over = True
+                self.emit("game_over", score=self.score)
+                break
+
+    def apply_gravity(self):
+        """重力を適用し、動いたぷよを(列, 元の行, 移動先の行)のリストで返す"""
+        moves = self.board.collapse()
+        if moves:
+            self.emit("fall", moves=moves)
+        return moves
+
+    def start_chain_check(self):
+        """連鎖チェックを開始"""
+        self.animation_state = "checking"
+        if self.cascade_cache is not None:
+            self.cascade_steps = self.cascade_cache.resolve(self.board)['steps']
+        self.check_chains()
+
+    def check_chains(self):
+        """連鎖をチェックして消去"""
+        # 4つ以上連結していれば消去対象に追加
+        if self.cascade_steps is not None:
+            steps = self.cascade_steps
+            groups = steps[self.chain_count] if self.chain_count < len(steps) else []
+        else:
+            groups = self.board.find_groups(4)
+        chains_found = bool(groups)
+        self.vanishing_puyos = []
+
+        for chain in groups:
+            self.vanishing_puyos.extend(chain)
+
+            # スコア加算
+            self.score += len(chain) * 10
+
+        if chains_found:
+            # 連鎖カウント増加
+            self.chain_count += 1
+            self.emit("chain", chain_count=self.chain_count, cells=list(self.vanishing_puyos))
+
+            # 消えるアニメーション開始
+            self.animation_state = "vanishing"
+            self.animation_time = 0
+        else:
+            # 連鎖がなければアニメーション終了
+            self.animation_state = None
+            self.cascade_steps = None
+
+    def update_animation(self, dt):
+        """アニメーション状態を更新"""
+        if self.animation_state == "vanishing":
+            self.animation_time += dt
+
+            # 消えるアニメーション終了
+            if self.animation_time >= VANISH_DURATION:
+                # ぷよを実際に消す
+                self.board.remove(self.vanishing_puyos)
+                self.emit("clear", cells=list(self.vanishing_puyos))
+
+                # 重力を適用（落下アニメーションは遅延の間に描画側で行う）
+                self.falling_moves = self.apply_gravity()
+
+                # 次の連鎖チェックを遅延実行
+                self.animation_state = "delay"
+                self.animation_time = 0
+
+        elif self.animation_state == "delay":
+            self.animation_time += dt
+
+            # 遅延終了後、次の連鎖チェック
+            if self.animation_time >= CHAIN_DELAY:
+                self.falling_moves = []
+                self.check_chains()
+
+    def update(self, dt):
+        """ゲーム状態を更新"""
+        if self.game_over:
+            return
+
+        # アニメーション更新
+        if self.animation_state:
+            self.update_animation(dt)
+            return
+
+        # 自動落下
+        self.fall_time += dt
+        if self.fall_time >= self.fall_speed:
+            self.fall_time = 0
+            if not self.move_puyo(0, 1):
+                self.lock_puyo()
@@ -1,96 +1,114 @@
+import os
 import pygame
+import struct
 import sys
-import random
-import os
 import time
 
+from engine import PuyoEngine, DIFFICULTY_LEVELS, GRID_WIDTH, GRID_HEIGHT, ROTATE, HARD_DROP
+from controls import InputHandler, KEY_ACTIONS
+from profiler import FrameProfiler
+from replay import ReplayRecorder
+from bot import Bot, AutoPlayer
+from text_cache import render_text
+from asset_manager import asset_manager
+from audio import audio, pre_init as pre_init_audio
+from renderer import Renderer, FADE_STEPS, FADE_STEPS_HIGH_QUALITY, SCREEN_WIDTH, SCREEN_HEIGHT, BLACK
+
 # ゲーム設定
-SCREEN_WIDTH = 600
-SCREEN_HEIGHT = 800
-GRID_WIDTH = 6
-GRID_HEIGHT = 12
-CELL_SIZE = 50
 FPS = 60
+TICK_RATE = 120  # ゲームロジックを進める回数（1秒あたり）。描画のフレームレートとは独立
+MAX_CATCH_UP_TICKS = 8  # 描画が詰まったときに1フレームで追いつく最大回数（超えた分は捨てる）
+FRAME_PACING = "sleep"  # "sleep"（clock.tick）、"busy"（clock.tick_busy_loop）、"vsync"（垂直同期）
+RECORD_REPLAYS = True  # Trueならゲームごとの入力をREPLAY_DIRに記録する（replay.pyで再生）
+REPLAY_DIR = "replays"
+AUTOPLAY = False  # Trueならボットが遊ぶ（Aキーで切替）
+PROFILE = False  # Trueなら最初からフレーム時間を計測して表示する（F3キーで切替、F4キーでCSV出力）
+BOARD_BACKEND = "bitboard"  # "list" または "bitboard"
+BOARD_SIZE = None  # (幅, 高さ)。負荷試験用の大きな盤面（例: (256, 512)）。表示範囲はぷよに合わせてスクロールする
+LARGE_BOARD_BACKEND = "list"  # BOARD_SIZEを指定したときのボードの実装（bitboardは盤面全体のビット演算になり、大きいと遅い）
+DIRTY_RECT_RENDERING = True  # Falseなら毎フレーム画面全体を描き直す
+HIGH_QUALITY_FADE = False  # Trueなら消えるアニメーションの段階を細かくする（メモリを多く使う）
+IDLE_WAIT_MS = 500  # メニュー、ポーズ、ゲームオーバー画面で入力を待つ最大時間（ミリ秒）。時間で変わる表示はこの間隔で更新する
 
 # ゲームタイトル
 GAME_TITLE_JP = "AWSツヨツヨ"
 GAME_TITLE_EN = "AWS Tsuyo-Tsuyo"
 
-# 難易度レベル設定
-DIFFICULTY_LEVELS = {
-    "初心者": 4,
-    "中級者": 6,
-    "上級者": 20
-}
+# 垂直同期が有効になったかどうか（create_screenで設定）
+vsync_enabled = False
 
-# 色の定義
-BLACK = (0, 0, 0)
-WHITE = (255, 255, 255)
-GRAY = (200, 200, 200)
-COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255)]
+def create_screen():
+    """ゲーム画面を作る（FRAME_PACINGが"vsync"なら垂直同期を有効にする）"""
+    global vsync_enabled
+    if FRAME_PACING == "vsync":
+        try:
+            screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SCALED, vsync=1)
+            vsync_enabled = True
+            return screen
+        except pygame.error:
+            print("垂直同期が使えないため、clock.tick_busy_loopで待ちます")
+    vsync_enabled = False
+    return pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
-# アニメーション設定
-CHAIN_DELAY = 0.5  # 連鎖間の遅延（秒）
-VANISH_DURATION = 0.3  # 消える時のアニメーション時間（秒）
+def wait_next_frame(clock, presented=True):
+    """次のフレームまで待つ（presentedはこのフレームで画面を更新したかどうか）"""
+    if vsync_enabled and presented:
+        # 画面の更新が垂直同期を待つので、ここでは時間を測るだけ
+        clock.tick()
+    elif vsync_enabled:
+        # 変わった範囲が無く画面を更新しなかったフレームは垂直同期を待たないので、時間で待つ
+        clock.tick(FPS)
+    elif FRAME_PACING == "sleep":
+        clock.tick(FPS)
+    else:
+        # 垂直同期が使えなかった場合もこちら
+        clock.tick_busy_loop(FPS)
 
-# フォントの設定
-def get_font(size):
-    try:
-        # macOSの日本語フォント
-        return pygame.font.Font("/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc", size)
-    except:
-        try:
-            # Windowsの日本語フォント
-            return pygame.font.Font("C:\\Windows\\Fonts\\msgothic.ttc", size)
-        except:
-            # それでもダメならデフォルトフォント
-            return pygame.font.SysFont(None, size)
+def wait_events(timeout=IDLE_WAIT_MS):
+    """
+    イベントが来るまで最大timeoutミリ秒眠って待ち、届いたイベントのリストを返す
+
+    画面が変わらない間はフレームを回さないので、CPUをほとんど使わない。
+    """
+    event = pygame.event.wait(timeout)
+    if event.type == pygame.NOEVENT:
+        return []
+    return [event] + pygame.event.get()
 
 class DifficultySelector:
     def __init__(self, screen):
         self.screen = screen
-        self.font_large = get_font(48)
-        self.font = get_font(36)
+        self.font_large = asset_manager.font(48)
+        self.font = asset_manager.font(36)
         self.selected = 0
         self.difficulties = list(DIFFICULTY_LEVELS.keys())
         
         # BGMが再生されていない場合は開始
-        if not pygame.mixer.music.get_busy():
-            try:
-                pygame.mixer.music.load('assets/bgm.mp3')
-                pygame.mixer.music.play(-1)  # -1は無限ループ
-            except:
-                print("BGMの読み込みに失敗しました")
-        
-        # 背景画像の読み込み
-        try:
-            self.bg_image = pygame.image.load('assets/bg.jpg')
-            self.bg_image = pygame.transform.scale(self.bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT))
-        except:
-            # 背景画像が読み込めない場合は白色の背景を使用
-            self.bg_image = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-            self.bg_image.fill(WHITE)
+        audio.start_bgm()
+        
+        # 背景画像
+        self.bg_image = asset_manager.background()
     
     def draw(self):
         # 背景画像を描画
         self.screen.blit(self.bg_image, (0, 0))
         
         # タイトル
-        title = self.font_large.render(GAME_TITLE_JP, True, BLACK)
+        title = render_text(self.font_large, GAME_TITLE_JP, BLACK)
         self.screen.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, 100))
         
         # 難易度選択
-        subtitle = self.font.render("難易度を選択してください", True, BLACK)
+        subtitle = render_text(self.font, "難易度を選択してください", BLACK)
         self.screen.blit(subtitle, (SCREEN_WIDTH // 2 - subtitle.get_width() // 2, 200))
         
         # 難易度オプション
         for i, diff in enumerate(self.difficulties):
             color = (255, 0, 0) if i == self.selected else BLACK
-            text = self.font.render(f"{i+1}. {diff}", True, color)
+            text = render_text(self.font, f"{i+1}. {diff}", color)
             self.screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 300 + i * 50))
         
         # 操作説明
-        instruction = self.font.render("上下キーで選択、Enterで決定", True, BLACK)
+        instruction = render_text(self.font, "上下キーで選択、Enterで決定", BLACK)
         self.screen.blit(instruction, (SCREEN_WIDTH // 2 - instruction.get_width() // 2, 500))
         
         pygame.display.flip()
@@ -110,520 +128,295 @@ class DifficultySelector:
         return None
     
     def run(self):
-        clock = pygame.time.Clock()
         selected_difficulty = None
+        self.draw()
         
+        # キー入力を待つ間は眠っていて、選択が変わったときとウィンドウが隠れたあとだけ描き直す
         while selected_difficulty is None:
-            for event in pygame.event.get():
+            redraw = False
+            for event in wait_events():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     sys.exit()
                 
+                previous = self.selected
                 selected_difficulty = self.handle_event(event)
+                if selected_difficulty is not None:
+                    break
+                redraw |= self.selected != previous or event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED)
             
-            self.draw()
-            clock.tick(FPS)
+            if redraw:
+                self.draw()
         
         return selected_difficulty
 
-# アイコンの読み込み関数
-def load_aws_icons(count=20):
-    """
-    assetsフォルダからAWSアイコンを読み込む
-    """
-    icon_paths = []
-    for i in range(count):
-        icon_path = f'assets/icon_{i}.png'
-        if os.path.exists(icon_path):
-            icon_paths.append(icon_path)
-    
-    # 十分なアイコンがない場合はエラーメッセージを表示
-    if len(icon_paths) < count:
-        print(f"Warning: Requested {count} icons but only found {len(icon_paths)}")
-    
-    return icon_paths
-
 class PuyoGame:
     def __init__(self, difficulty="初心者", screen=None):
         if screen is None:
+            pre_init_audio()  # ミキサーの設定はpygame.initより前に指定する
             pygame.init()
-            pygame.mixer.init()  # サウンドミキサーを初期化
-            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            audio.init()
+            self.screen = create_screen()
             pygame.display.set_caption(GAME_TITLE_EN)
         else:
             self.screen = screen
             
         self.clock = pygame.time.Clock()
-        self.font = get_font(36)
+        self.font = asset_manager.font(36)
         
-        # BGMの読み込みと再生
-        try:
-            pygame.mixer.music.load('assets/bgm.mp3')
-            pygame.mixer.music.play(-1)  # -1は無限ループ
-            self.sound_on = True
-        except:
-            print("BGMの読み込みに失敗しました")
-            self.sound_on = False
-        
-        # 背景画像の読み込み
-        try:
-            self.bg_image = pygame.image.load('assets/bg.jpg')
-            self.bg_image = pygame.transform.scale(self.bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT))
-        except:
-            # 背景画像が読み込めない場合は白色の背景を使用
-            self.bg_image = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-            self.bg_image.fill(WHITE)
-        
-        # 難易度に基づいてアイコン数を設定
-        self.difficulty = difficulty
-        self.icon_count = DIFFICULTY_LEVELS[difficulty]
+        # BGMの再生（再生中ならそのまま続ける）
+        # 効果音はBGMが読み込めなくても鳴らす。オン/オフは難易度選択に戻っても引き継ぐ
+        audio.start_bgm()
+        self.sound_on = audio.ready and audio.effects_on
+        
+        # 背景画像
+        self.bg_image = asset_manager.background()
         
-        # アイコンをダウンロード
-        self.icons = []
+        # 難易度に基づいてアイコンを用意
+        self.difficulty = difficulty
         self.load_icons()
         
-        # ゲームボード初期化
-        self.board = [[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
+        # キー入力（押しっぱなしのリピートと入力遅延の計測）
+        self.input = InputHandler()
         
-        # 現在のぷよ
-        self.current_puyo = self.create_new_puyo()
-        self.next_puyo = self.create_new_puyo()
+        # フレーム時間の計測
+        self.profiler = FrameProfiler(enabled=PROFILE)
         
-        # ゲーム状態
-        self.game_over = False
-        self.score = 0
-        self.fall_time = 0
-        self.fall_speed = 0.5  # 秒単位
-        self.return_to_menu = False
-        self.paused = False
-        
-        # アニメーション状態
-        self.animation_state = None  # None, "vanishing", "falling"
-        self.animation_time = 0
-        self.vanishing_puyos = []
-        self.chain_count = 0
+        # 入力の記録（ゲームごとに作り直す）
+        self.recorder = None
         
-    def load_icons(self):
-        """アイコンを読み込む"""
-        icon_paths = load_aws_icons(self.icon_count)
-        for path in icon_paths:
-            icon = pygame.image.load(path)
-            self.icons.append(icon)
-    
-    def create_new_puyo(self):
-        """新しいぷよを作成"""
-        if len(self.icons) < 2:
-            return None
-        
-        # ランダムに2つのアイコンを選択
-        icon1 = random.randint(0, len(self.icons) - 1)
-        icon2 = random.randint(0, len(self.icons) - 1)
-        
-        # 初期位置
-        x = GRID_WIDTH // 2 - 1
-        y = 0
-        
-        return {
-            'position': [(x, y), (x, y + 1)],
-            'icons': [icon1, icon2],
-            'rotation': 0
-        }
-    
-    def draw_board(self):
-        """ゲームボードを描画"""
-        # 背景画像を描画
-        self.screen.blit(self.bg_image, (0, 0))
+        # オートプレイ（ゲームごとに作り直す）
+        self.autoplay = AUTOPLAY
+        self.autoplayer = None
         
-        # ゲームエリアの半透明オーバーレイ
-        game_area = pygame.Surface((GRID_WIDTH * CELL_SIZE, GRID_HEIGHT * CELL_SIZE), pygame.SRCALPHA)
-        game_area.fill((255, 255, 255, 128))  # 白色の半透明
-        self.screen.blit(game_area, (0, 0))
-        
-        # グリッド線
-        for x in range(GRID_WIDTH + 1):
-            pygame.draw.line(
-                self.screen, 
-                GRAY, 
-                (x * CELL_SIZE, 0), 
-                (x * CELL_SIZE, GRID_HEIGHT * CELL_SIZE)
-            )
-        
-        for y in range(GRID_HEIGHT + 1):
-            pygame.draw.line(
-                self.screen, 
-                GRAY, 
-                (0, y * CELL_SIZE), 
-                (GRID_WIDTH * CELL_SIZE, y * CELL_SIZE)
-            )
-        
-        # ボード上のぷよを描画
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                if self.board[y][x] is not None:
-                    # 消えるアニメーション中のぷよは半透明に
-                    if self.animation_state == "vanishing" and (x, y) in self.vanishing_puyos:
-                        progress = self.animation_time / VANISH_DURATION
-                        alpha = int(255 * (1 - progress))
-                        
-                        # 元のアイコンを取得
-                        icon = self.icons[self.board[y][x]]
-                        
-                        # 半透明のコピーを作成
-                        icon_copy = icon.copy()
-                        icon_copy.set_alpha(alpha)
-                        
-                        self.screen.blit(
-                            icon_copy, 
-                            (x * CELL_SIZE, y * CELL_SIZE)
-                        )
-                    else:
-                        self.screen.blit(
-                            self.icons[self.board[y][x]], 
-                            (x * CELL_SIZE, y * CELL_SIZE)
-                        )
-        
-        # 現在のぷよを描画
-        if self.current_puyo and not self.animation_state:
-            for i, (x, y) in enumerate(self.current_puyo['position']):
-                if 0 <= y < GRID_HEIGHT and 0 <= x < GRID_WIDTH:
-                    self.screen.blit(
-                        self.icons[self.current_puyo['icons'][i]], 
-                        (x * CELL_SIZE, y * CELL_SIZE)
-                    )
-        
-        # 次のぷよを表示
-        if self.next_puyo:
-            text = self.font.render("Next:", True, BLACK)
-            self.screen.blit(text, (GRID_WIDTH * CELL_SIZE + 20, 20))
-            
-            for i, icon_idx in enumerate(self.next_puyo['icons']):
-                self.screen.blit(
-                    self.icons[icon_idx], 
-                    (GRID_WIDTH * CELL_SIZE + 20, 60 + i * CELL_SIZE)
-                )
-        
-        # スコア表示
-        score_text = self.font.render(f"Score: {self.score}", True, BLACK)
-        self.screen.blit(score_text, (GRID_WIDTH * CELL_SIZE + 20, 180))
-        
-        # 難易度表示
-        diff_text = self.font.render(f"難易度: {self.difficulty}", True, BLACK)
-        self.screen.blit(diff_text, (GRID_WIDTH * CELL_SIZE + 20, 220))
-        
-        # 連鎖数表示
-        if self.chain_count > 0:
-            chain_text = self.font.render(f"{self.chain_count}連鎖!", True, (255, 0, 0))
-            self.screen.blit(chain_text, (GRID_WIDTH * CELL_SIZE + 20, 260))
-        
-        # サウンド状態表示
-        sound_text = self.font.render(f"サウンド: {'ON' if self.sound_on else 'OFF'}", True, BLACK)
-        self.screen.blit(sound_text, (GRID_WIDTH * CELL_SIZE + 20, 300))
-        sound_hint = self.font.render("Sキーで切替", True, GRAY)
-        self.screen.blit(sound_hint, (GRID_WIDTH * CELL_SIZE + 20, 330))
-        
-        # ポーズ表示
-        if self.paused:
-            # 半透明のオーバーレイ
-            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 128))  # 黒色の半透明
-            self.screen.blit(overlay, (0, 0))
-            
-            # ポーズテキスト
-            pause_text = self.font.render("PAUSE", True, WHITE)
-            self.screen.blit(pause_text, (SCREEN_WIDTH // 2 - pause_text.get_width() // 2, SCREEN_HEIGHT // 2 - 50))
-            
-            # 操作説明
-            resume_text = self.font.render("Pキーで再開", True, WHITE)
-            self.screen.blit(resume_text, (SCREEN_WIDTH // 2 - resume_text.get_width() // 2, SCREEN_HEIGHT // 2 + 10))
-        
-        # ゲームオーバー表示
-        if self.game_over:
-            game_over_text = self.font.render("GAME OVER", True, (255, 0, 0))
-            self.screen.blit(game_over_text, (GRID_WIDTH * CELL_SIZE // 2 - 80, GRID_HEIGHT * CELL_SIZE // 2))
-            
-            restart_text = self.font.render("Rキーでリスタート", True, BLACK)
-            self.screen.blit(restart_text, (GRID_WIDTH * CELL_SIZE // 2 - 100, GRID_HEIGHT * CELL_SIZE // 2 + 40))
-            
-            menu_text = self.font.render("Mキーで難易度選択", True, BLACK)
-            self.screen.blit(menu_text, (GRID_WIDTH * CELL_SIZE // 2 - 100, GRID_HEIGHT * CELL_SIZE // 2 + 80))
-    
-    def move_puyo(self, dx=0, dy=0):
-        """ぷよを移動"""
-        if self.game_over or not self.current_puyo or self.paused or self.animation_state:
-            return False
-        
-        # 移動後の位置を計算
-        new_positions = [(x + dx, y + dy) for x, y in self.current_puyo['position']]
-        
-        # 移動が有効かチェック
-        if self.is_valid_position(new_positions):
-            self.current_puyo['position'] = new_positions
-            return True
-        return False
-    
-    def rotate_puyo(self):
-        """ぷよを回転"""
-        if self.game_over or not self.current_puyo or self.paused or self.animation_state:
-            return False
-        
-        # 回転の中心を取得
-        center_x, center_y = self.current_puyo['position'][0]
-        
-        # 2つ目のぷよの相対位置を計算
-        x2, y2 = self.current_puyo['position'][1]
-        rel_x, rel_y = x2 - center_x, y2 - center_y
-        
-        # 時計回りに90度回転
-        new_rel_x, new_rel_y = -rel_y, rel_x
-        
-        # 新しい位置を計算
-        new_positions = [(center_x, center_y), (center_x + new_rel_x, center_y + new_rel_y)]
-        
-        # 回転が有効かチェック
-        if self.is_valid_position(new_positions):
-            self.current_puyo['position'] = new_positions
-            self.current_puyo['rotation'] = (self.current_puyo['rotation'] + 1) % 4
-            return True
-        
-        # 壁キック処理（壁際で回転できない場合、少し横にずらす）
-        kick_offsets = [(-1, 0), (1, 0), (0, -1)]
-        for offset_x, offset_y in kick_offsets:
-            kicked_positions = [(pos[0] + offset_x, pos[1] + offset_y) for pos in new_positions]
-            if self.is_valid_position(kicked_positions):
-                self.current_puyo['position'] = kicked_positions
-                self.current_puyo['rotation'] = (self.current_puyo['rotation'] + 1) % 4
-                return True
-        
-        return False
-    
-    def is_valid_position(self, positions):
-        """指定された位置が有効かどうかをチェック"""
-        for x, y in positions:
-            # 画面外チェック
-            if x < 0 or x >= GRID_WIDTH or y >= GRID_HEIGHT:
-                return False
-            
-            # 他のぷよとの衝突チェック
-            if y >= 0 and self.board[y][x] is not None:
-                return False
+        # ゲーム状態
+        self.reset_state()
         
-        return True
-    
-    def lock_puyo(self):
-        """現在のぷよをボードに固定"""
-        for i, (x, y) in enumerate(self.current_puyo['position']):
-            if 0 <= y < GRID_HEIGHT and 0 <= x < GRID_WIDTH:
-                self.board[y][x] = self.current_puyo['icons'][i]
-        
-        # 浮いているぷよをチェック
-        self.check_floating_puyos()
-        
-        # 連鎖チェック
-        self.chain_count = 0
-        self.start_chain_check()
-        
-        # 次のぷよを取得
-        self.current_puyo = self.next_puyo
-        self.next_puyo = self.create_new_puyo()
-        
-        # ゲームオーバーチェック
-        for x, y in self.current_puyo['position']:
-            if y >= 0 and self.board[y][x] is not None:
-                self.game_over = True
-                break
-    
-    def check_floating_puyos(self):
-        """浮いているぷよをチェックして落とす"""
-        # 各列ごとに下から上に向かってチェック
-        for x in range(GRID_WIDTH):
-            # 各列の最下部から上に向かって空白を探す
-            for y in range(GRID_HEIGHT - 1, 0, -1):
-                if self.board[y][x] is None:
-                    # 空白の上にあるぷよを見つけて落とす
-                    for above_y in range(y - 1, -1, -1):
-                        if self.board[above_y][x] is not None:
-                            self.board[y][x] = self.board[above_y][x]
-                            self.board[above_y][x] = None
-                            break
-    
-    def apply_gravity(self):
-        """重力を適用（ぷよを下に落とす）"""
-        moved = False
-        
-        # 各列ごとに独立して重力を適用
-        for x in range(GRID_WIDTH):
-            # 下から上に向かってチェック
-            for y in range(GRID_HEIGHT - 2, -1, -1):
-                if self.board[y][x] is not None and self.board[y + 1][x] is None:
-                    # 下が空いていれば落とす
-                    self.board[y + 1][x] = self.board[y][x]
-                    self.board[y][x] = None
-                    moved = True
-        
-        return moved
-    
-    def start_chain_check(self):
-        """連鎖チェックを開始"""
-        self.animation_state = "checking"
-        self.check_chains()
+    def load_icons(self):
+        """難易度に応じたアイコンを用意（読み込み済みなら使い回す）"""
+        self.icon_count = DIFFICULTY_LEVELS[self.difficulty]
+        steps = FADE_STEPS_HIGH_QUALITY if HIGH_QUALITY_FADE else FADE_STEPS
+        icon_set = asset_manager.icons(self.icon_count, steps)
+        self.icons = icon_set['icons']
+        
+        # 描画
+        self.renderer = Renderer(self.screen, self.font, self.icons, self.bg_image,
+                                 fade_ramps=icon_set['fade_ramps'], icon_atlas=icon_set['atlas'],
+                                 icon_rects=icon_set['rects'], full_redraw=not DIRTY_RECT_RENDERING,
+                                 overlay_font=asset_manager.font(20))
     
-    def check_chains(self):
-        """連鎖をチェックして消去"""
-        # 連結成分を見つける
-        visited = [[False for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-        chains_found = False
-        self.vanishing_puyos = []
-        
-        for y in range(GRID_HEIGHT):
-            for x in range(GRID_WIDTH):
-                if self.board[y][x] is not None and not visited[y][x]:
-                    chain = []
-                    self.find_chain(x, y, self.board[y][x], visited, chain)
-                    
-                    # 4つ以上連結していれば消去対象に追加
-                    if len(chain) >= 4:
-                        chains_found = True
-                        self.vanishing_puyos.extend(chain)
-                        
-                        # スコア加算
-                        self.score += len(chain) * 10
-        
-        if chains_found:
-            # 連鎖カウント増加
-            self.chain_count += 1
-            
-            # 消えるアニメーション開始
-            self.animation_state = "vanishing"
-            self.animation_time = 0
+    def reset_state(self):
+        """ゲーム状態を初期化（アセットは読み込み直さない）"""
+        # 途中までのゲームの記録を保存
+        if self.recorder is not None:
+            self.save_replay()
+        
+        # ルールエンジン初期化
+        if BOARD_SIZE:
+            (width, height), self.board_backend = BOARD_SIZE, LARGE_BOARD_BACKEND
         else:
-            # 連鎖がなければアニメーション終了
-            self.animation_state = None
-    
-    def find_chain(self, x, y, icon_type, visited, chain):
-        """同じ種類のぷよの連結を探索（深さ優先探索）"""
-        # 範囲外チェック
-        if x < 0 or x >= GRID_WIDTH or y < 0 or y >= GRID_HEIGHT:
-            return
+            (width, height), self.board_backend = (GRID_WIDTH, GRID_HEIGHT), BOARD_BACKEND
+        self.engine = PuyoEngine(len(self.icons), width, height, board_backend=self.board_backend)
+        self.recorder = ReplayRecorder(self.engine, TICK_RATE)
+        self.renderer.invalidate()
         
-        # 既に訪問済みか、異なるタイプのぷよかチェック
-        if visited[y][x] or self.board[y][x] != icon_type:
-            return
+        # ボットはアイコン数ごとに作るので、難易度が変わっても作り直す
+        self.report_autoplay()
+        self.autoplayer = None
+        if self.autoplay:
+            self.start_autoplay()
         
-        # このぷよを連結に追加
-        visited[y][x] = True
-        chain.append((x, y))
-        
-        # 4方向を探索
-        directions = [(0, -1), (1, 0), (0, 1), (-1, 0)]
-        for dx, dy in directions:
-            self.find_chain(x + dx, y + dy, icon_type, visited, chain)
-    
-    def update_animation(self, dt):
-        """アニメーション状態を更新"""
-        if self.animation_state == "vanishing":
-            self.animation_time += dt
-            
-            # 消えるアニメーション終了
-            if self.animation_time >= VANISH_DURATION:
-                # ぷよを実際に消す
-                for x, y in self.vanishing_puyos:
-                    if 0 <= y < GRID_HEIGHT and 0 <= x < GRID_WIDTH:
-                        self.board[y][x] = None
-                
-                # 落下アニメーション開始
-                self.animation_state = "falling"
-                self.animation_time = 0
-                
-                # 重力を適用
-                while self.apply_gravity():
-                    pass
-                
-                # 浮いているぷよをチェック
-                self.check_floating_puyos()
-                
-                # 次の連鎖チェックを遅延実行
-                self.animation_state = "delay"
-                self.animation_time = 0
+        self.return_to_menu = False
+        self.paused = False
+        self.input.reset()
         
-        elif self.animation_state == "delay":
-            self.animation_time += dt
-            
-            # 遅延終了後、次の連鎖チェック
-            if self.animation_time >= CHAIN_DELAY:
-                self.check_chains()
+        # 固定間隔のロジック更新に持ち越す時間とアクション
+        self.accumulator = 0.0
+        self.pending_actions = []
+        # 描画時点でまだロジックに反映していない時間（秒）。アニメーションの補間に使う
+        self.frame_lag = 0.0
     
-    def update(self, dt):
-        """ゲーム状態を更新"""
-        if self.game_over or self.paused:
-            return
-        
-        # アニメーション更新
-        if self.animation_state:
-            self.update_animation(dt)
-            return
-        
-        # 自動落下
-        self.fall_time += dt
-        if self.fall_time >= self.fall_speed:
-            self.fall_time = 0
-            if not self.move_puyo(0, 1):
-                self.lock_puyo()
+    def draw_board(self):
+        """ゲームボードを描画し、画面に送るべき矩形のリストを返す（全体ならNone）"""
+        return self.renderer.draw(self)
     
     def restart(self):
         """ゲームをリスタート"""
-        self.__init__(self.difficulty, self.screen)
+        self.reset_state()
     
     def change_difficulty(self, difficulty):
         """難易度を変更"""
         if difficulty in DIFFICULTY_LEVELS:
-            self.__init__(difficulty, self.screen)
+            self.difficulty = difficulty
+            self.load_icons()
+            self.reset_state()
     
     def toggle_pause(self):
         """ポーズ状態を切り替え"""
-        if not self.game_over:
+        if not self.engine.game_over:
             self.paused = not self.paused
+            # ポーズ中に離したキーがリピートし続けないように
+            self.input.reset()
+    
+    def is_idle(self):
+        """ロジックが止まっていて、入力が無い限り画面が変わらない状態か（ポーズ中とゲームオーバー）"""
+        return self.paused or self.engine.game_over
     
     def toggle_sound(self):
         """サウンドのオン/オフを切り替え"""
         self.sound_on = not self.sound_on
-        if self.sound_on:
-            pygame.mixer.music.unpause()
+        audio.set_enabled(self.sound_on)
+    
+    def save_replay(self):
+        """記録したゲームをリプレイファイルに保存（1ゲームにつき1回）"""
+        if not RECORD_REPLAYS or self.recorder.saved or not self.engine.steps:
+            return
+        os.makedirs(REPLAY_DIR, exist_ok=True)
+        path = os.path.join(REPLAY_DIR, time.strftime("replay_%Y%m%d_%H%M%S") + f"_{self.engine.seed:08x}.puyo")
+        try:
+            self.recorder.save(path)
+        except (OSError, struct.error) as e:
+            print(f"リプレイの保存に失敗しました: {e}")
+    
+    def start_autoplay(self):
+        """ボットに遊ばせる"""
+        if BOARD_SIZE:
+            # 置き場所の列挙と評価が盤面全体を調べるので、大きな盤面では1手に数十秒かかる
+            print("大きな盤面（BOARD_SIZE）ではオートプレイを使えません")
+            self.autoplay = False
+            return
+        bot = Bot(len(self.icons), self.engine.width, self.engine.height, self.board_backend)
+        self.autoplayer = AutoPlayer(bot)
+    
+    def toggle_autoplay(self):
+        """オートプレイを切り替え"""
+        self.autoplay = not self.autoplay
+        if self.autoplay:
+            self.start_autoplay()
         else:
-            pygame.mixer.music.pause()
+            self.report_autoplay()
+            self.autoplayer = None
+    
+    def report_autoplay(self):
+        """ボットの思考時間と、1秒あたりに評価した局面数を表示"""
+        if self.autoplayer is None or not self.autoplayer.bot.decisions:
+            return
+        think_ms, nodes_per_second, hit_rate, timeouts = self.autoplayer.bot.stats()
+        print(f"ボット: {self.autoplayer.bot.decisions}手 思考 {think_ms:.1f}ms/手 "
+              f"{nodes_per_second:,.0f}局面/秒 再利用 {hit_rate:.0%} 時間切れ {timeouts}回")
+    
+    def toggle_profiler(self):
+        """フレーム時間の計測と表示を切り替え"""
+        self.profiler.set_enabled(not self.profiler.enabled)
+    
+    def dump_profile(self):
+        """計測したフレーム時間をCSVに書き出す"""
+        path = self.profiler.dump_csv()
+        if path:
+            print(f"フレーム時間を{path}に書き出しました")
+    
+    def advance(self, elapsed, actions, now=None):
+        """
+        経過時間elapsed秒ぶんロジックを固定間隔（1/TICK_RATE秒）で進める
+        
+        端数は次のフレームに持ち越す。描画が詰まってもMAX_CATCH_UP_TICKS回までしか
+        追いつかないので、時間が一気に進んでアニメーションが飛ぶことはない。
+        actionsは時刻付きの(時刻, アクション)で、その時刻までを進める更新で適用する。
+        このフレームで最後の更新では残りをすべて適用するので、1フレーム遅れることはない
+        （このフレームで1回も進めなければ次のフレームに持ち越す）。
+        """
+        if now is None:
+            now = time.perf_counter()
+        tick = 1 / TICK_RATE
+        self.pending_actions.extend(actions)
+        self.accumulator = min(self.accumulator + elapsed, MAX_CATCH_UP_TICKS * tick)
+        
+        # 次の更新が進め終わる時刻
+        tick_end = now - self.accumulator + tick
+        while self.accumulator >= tick:
+            if self.accumulator < 2 * tick:
+                due = self.pending_actions
+            else:
+                due = [item for item in self.pending_actions if item[0] < tick_end]
+            if due:
+                self.pending_actions = self.pending_actions[len(due):]
+                for timestamp, _ in due:
+                    self.input.mark_applied(timestamp)
+            actions = [action for _, action in due]
+            if self.autoplayer is not None:
+                actions += self.autoplayer.next_actions(self.engine)
+            self.recorder.record(actions)
+            self.play_sounds(self.engine.step(tick, actions))
+            self.accumulator -= tick
+            tick_end += tick
+        self.frame_lag = self.accumulator
+        
+        if self.engine.game_over:
+            self.save_replay()
+    
+    def play_sounds(self, events):
+        """エンジンのイベントに合わせて効果音を鳴らす"""
+        for event in events:
+            kind = event['type']
+            if kind == "action" and event['action'] != HARD_DROP:  # ハードドロップは固定の音だけ
+                audio.play("rotate" if event['action'] == ROTATE else "move")
+            elif kind == "chain":
+                audio.play("chain", event['chain_count'] - 1)
+            elif kind in ("lock", "clear", "game_over"):
+                audio.play(kind)
     
     def run(self):
         """ゲームループ"""
         running = True
-        last_time = pygame.time.get_ticks() / 1000.0
+        last_time = time.perf_counter()
         
         while running:
-            # デルタタイム計算
-            current_time = pygame.time.get_ticks() / 1000.0
-            dt = current_time - last_time
+            if self.is_idle():
+                # 画面が変わらないので、入力が来るまで眠って待つ（来たらすぐにこのフレームで処理する）
+                events = wait_events()
+                # 待っていた時間ぶんロジックを進めない
+                last_time = time.perf_counter()
+            else:
+                events = None
+            
+            # 前のフレームからの経過時間
+            current_time = time.perf_counter()
+            elapsed = current_time - last_time
             last_time = current_time
+            self.profiler.begin_frame(current_time)
             
-            # イベント処理
-            for event in pygame.event.get():
+            # イベント処理（ロジックを進める直前に読む）
+            if events is None:
+                events = pygame.event.get()
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
                 
+                elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    # ウィンドウが隠れていた部分を描き直す
+                    self.renderer.invalidate()
+                
+                elif event.type == pygame.KEYUP:
+                    self.input.key_up(event.key)
+                
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_p:
                         self.toggle_pause()
                     elif event.key == pygame.K_s:
                         self.toggle_sound()
+                    elif event.key == pygame.K_a:
+                        self.toggle_autoplay()
+                    elif event.key == pygame.K_F3:
+                        self.toggle_profiler()
+                    elif event.key == pygame.K_F4:
+                        self.dump_profile()
                     elif not self.paused:  # ポーズ中は他のキー入力を無視
-                        if event.key == pygame.K_LEFT:
-                            self.move_puyo(-1, 0)
-                        elif event.key == pygame.K_RIGHT:
-                            self.move_puyo(1, 0)
-                        elif event.key == pygame.K_DOWN:
-                            self.move_puyo(0, 1)
-                        elif event.key == pygame.K_UP or event.key == pygame.K_SPACE:
-                            self.rotate_puyo()
+                        if event.key in KEY_ACTIONS:
+                            # 移動と回転（押しっぱなしのリピートも含めてロジックを進めるときに適用）
+                            self.input.key_down(event.key, current_time)
                         elif event.key == pygame.K_r:
                             self.restart()
-                        elif event.key == pygame.K_m and self.game_over:
+                        elif event.key == pygame.K_m and self.engine.game_over:
                             self.return_to_menu = True
                             running = False
                         elif event.key == pygame.K_1:
@@ -633,22 +426,48 @@ class PuyoGame:
                         elif event.key == pygame.K_3:
                             self.change_difficulty("上級者")
             
-            # ゲーム状態更新
-            self.update(dt)
+            actions = self.input.poll(current_time)
+            self.profiler.mark("input")
+            
+            # ゲーム状態更新（ポーズ中は止める）
+            if not self.paused:
+                self.advance(elapsed, actions, current_time)
+            self.profiler.mark("update")
             
-            # 描画
-            self.draw_board()
-            pygame.display.flip()
+            # 描画（変わった範囲だけを画面に送る）
+            rects = self.draw_board()
+            self.profiler.mark("draw")
+            if rects is None:
+                pygame.display.flip()
+            elif rects:
+                pygame.display.update(rects)
+            self.input.mark_presented()
+            self.profiler.mark("present")
             
             # フレームレート制御
-            self.clock.tick(FPS)
+            wait_next_frame(self.clock, rects != [])
+            self.profiler.mark("wait")
+            self.profiler.end_frame()
+        
+        if self.profiler.enabled:
+            self.dump_profile()
+        self.save_replay()
+        self.report_autoplay()
+        
+        count, average_ms, max_ms = self.input.latency_stats()
+        if count:
+            print(f"入力遅延: 平均 {average_ms:.1f}ms, 最大 {max_ms:.1f}ms（直近{count}回）")
+        if audio.played:
+            print(f"効果音: {audio.played}回（チャンネルが埋まっていて止めた音 {audio.stolen}回、"
+                  f"ミキサーのバッファ {audio.buffer_latency_ms():.1f}ms）")
         
         return self.return_to_menu
 
 def main():
+    pre_init_audio()  # ミキサーの設定はpygame.initより前に指定する
     pygame.init()
-    pygame.mixer.init()  # サウンドミキサーを初期化
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    audio.init()  # 効果音はここでまとめてメモリに読み込む
+    screen = create_screen()
     pygame.display.set_caption(GAME_TITLE_EN)
     
     while True:
@@ -0,0 +1,122 @@
+"""
+フレームごとの処理時間の計測
+
+ゲームループの各段階（入力、ロジック更新、描画、画面への転送、待ち時間）に
+かかった時間を固定長のリングバッファに記録し、p50/p95/p99と最大値を求める。
+無効の間は各呼び出しがすぐに戻るので、ほとんどコストがかからない。
+"""
+import csv
+import time
+from array import array
+
+# 計測する段階（ゲームループで呼ぶ順）
+PHASES = ("input", "update", "draw", "present", "wait")
+
+# 覚えておくフレーム数
+PROFILE_FRAMES = 600
+
+# オーバーレイの数値を計算し直す間隔（フレーム数）
+OVERLAY_REFRESH_FRAMES = 30
+
+
+def percentile(sorted_values, p):
+    """ソート済みのリストのpパーセンタイル（最近傍）を返す"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class FrameProfiler:
+    def __init__(self, capacity=PROFILE_FRAMES, enabled=False):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.samples = {phase: array('d', [0.0]) * capacity for phase in PHASES}
+        self.totals = array('d', [0.0]) * capacity
+        self.frame_numbers = array('q', [0]) * capacity
+        self.frame = 0  # 記録したフレームの通し番号
+        self.count = 0  # バッファに入っているフレーム数
+        self.index = 0  # 次に書き込む位置
+        self.last_mark = 0.0
+        self.frame_start = 0.0
+        self.overlay = []
+
+    def set_enabled(self, enabled):
+        """計測を開始/停止する（再開時は前の記録を捨てる）"""
+        if enabled and not self.enabled:
+            self.clear()
+            # フレームの途中で有効にしても、最初の区間が起動からの時間にならないように
+            self.frame_start = self.last_mark = time.perf_counter()
+        self.enabled = enabled
+
+    def clear(self):
+        """記録を捨てる"""
+        self.count = 0
+        self.index = 0
+        self.overlay = []
+
+    def begin_frame(self, now=None):
+        """フレームの計測を始める"""
+        if not self.enabled:
+            return
+        if now is None:
+            now = time.perf_counter()
+        self.frame_start = self.last_mark = now
+
+    def mark(self, phase):
+        """前回のmarkからの時間をphaseの時間として記録する"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.samples[phase][self.index] = now - self.last_mark
+        self.last_mark = now
+
+    def end_frame(self):
+        """フレームの計測を終えてリングバッファを進める"""
+        if not self.enabled:
+            return
+        self.totals[self.index] = self.last_mark - self.frame_start
+        self.frame_numbers[self.index] = self.frame
+        self.frame += 1
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+        if self.frame % OVERLAY_REFRESH_FRAMES == 0:
+            self.overlay = self.overlay_lines()
+
+    def ordered(self, values):
+        """リングバッファの中身を古い順に返す"""
+        start = self.index - self.count
+        if start >= 0:
+            return list(values[start:self.index])
+        return list(values[start:]) + list(values[:self.index])
+
+    def summary(self):
+        """段階ごと（と'frame'）のp50、p95、p99、最大値（ミリ秒）の辞書を返す"""
+        result = {}
+        for name, values in [('frame', self.totals)] + [(phase, self.samples[phase]) for phase in PHASES]:
+            ms = sorted(value * 1000 for value in self.ordered(values))
+            result[name] = (percentile(ms, 50), percentile(ms, 95), percentile(ms, 99), ms[-1] if ms else 0.0)
+        return result
+
+    def overlay_lines(self):
+        """オーバーレイに表示する文字列のリストを返す"""
+        lines = [f"{'':7} {'p50':>5} {'p95':>5} {'p99':>5} {'max':>5} ms"]
+        for name, (p50, p95, p99, worst) in self.summary().items():
+            lines.append(f"{name:7} {p50:5.1f} {p95:5.1f} {p99:5.1f} {worst:5.1f}")
+        return lines
+
+    def dump_csv(self, path=None):
+        """記録したフレームをCSVに書き出し、書き出したパスを返す（記録が無ければNone）"""
+        if not self.count:
+            return None
+        if path is None:
+            path = time.strftime("profile_%Y%m%d_%H%M%S.csv")
+        columns = [self.ordered(self.frame_numbers), self.ordered(self.totals)]
+        columns += [self.ordered(self.samples[phase]) for phase in PHASES]
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'frame_ms'] + [f'{phase}_ms' for phase in PHASES])
+            for frame, *values in zip(*columns):
+                writer.writerow([frame] + [f'{value * 1000:.3f}' for value in values])
+        return path
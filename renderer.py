@@ -0,0 +1,397 @@
+"""
+ゲーム画面の描画
+
+前フレームから変わった部分（ボードのセル、現在/次のぷよ、HUDの文字列）だけを描き直し、
+pygame.display.update(rects)で必要な範囲だけを画面に送る。
+アイコンはアトラス画像があればそこから切り出し、1フレームの描画を1回のSurface.blits()にまとめる。
+
+盤面が画面に収まらないときは、GRID_WIDTH x GRID_HEIGHTセルの表示範囲（ビューポート）を
+現在のぷよに合わせてセル単位でスクロールし、範囲内のセルだけを描く。
+"""
+import time
+
+import pygame
+
+from text_cache import render_text
+from engine import GRID_WIDTH, GRID_HEIGHT, VANISH_DURATION, FALL_DURATION
+
+# 画面設定
+SCREEN_WIDTH = 600
+SCREEN_HEIGHT = 800
+CELL_SIZE = 50
+
+# 色の定義
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+GRAY = (200, 200, 200)
+RED = (255, 0, 0)
+
+# HUDの表示位置
+HUD_X = GRID_WIDTH * CELL_SIZE + 20
+
+# 一度に表示するセル数（盤面がこれより大きければスクロールする）
+VIEW_COLUMNS = GRID_WIDTH
+VIEW_ROWS = GRID_HEIGHT
+
+# スクロールするとき、現在のぷよと表示範囲の端との間に空けるセル数
+SCROLL_MARGIN = 2
+
+# 消えるアニメーションの段階数
+FADE_STEPS = 16
+FADE_STEPS_HIGH_QUALITY = 64
+
+# 着地位置のゴースト表示の不透明度（0で表示しない）
+GHOST_ALPHA = 0.35
+
+
+def build_fade_ramp(icon, steps=FADE_STEPS):
+    """アイコンを透明(0)から不透明(steps-1)まで段階的に半透明にした画像のリストを作る"""
+    ramp = []
+    for i in range(steps):
+        alpha = round(255 * i / (steps - 1))
+        if alpha >= 255:
+            ramp.append(icon)
+            continue
+        faded = icon.copy()
+        faded.set_alpha(alpha)
+        ramp.append(faded)
+    return ramp
+
+
+class Renderer:
+    def __init__(self, screen, font, icons, bg_image, fade_ramps=None,
+                 icon_atlas=None, icon_rects=None, full_redraw=False, overlay_font=None):
+        self.screen = screen
+        self.font = font
+        # 計測結果のオーバーレイ用の小さいフォント
+        self.overlay_font = overlay_font or font
+        self.icons = icons
+        self.bg_image = bg_image
+
+        # アトラス画像と、その中の各アイコンの矩形（無ければ個別の画像を使う）
+        self.icon_atlas = icon_atlas
+        self.icon_rects = icon_rects
+
+        # アイコンごとの半透明画像（無ければここで作る）
+        if fade_ramps is None:
+            fade_ramps = [build_fade_ramp(icon) for icon in icons]
+        self.fade_ramps = fade_ramps
+
+        # 背景などの動かない部分は1枚に合成して使い回す
+        self.static_layer = None
+        self.pause_overlay = None
+        self.static_size = None
+
+        # Trueなら毎フレーム画面全体を描き直す
+        self.full_redraw = full_redraw
+
+        # 表示範囲の左上のセル
+        self.view_x = 0
+        self.view_y = 0
+
+        # 名前 -> (元のリスト, 引き表)。大きな盤面では消える/落ちるセルが多いので毎フレーム作らない
+        self.lookups = {}
+
+        # 描画統計（フレーム数、描き直した面積、描画にかかった時間）
+        self.frames = 0
+        self.blit_area = 0
+        self.draw_time = 0.0
+
+        self.invalidate()
+
+    def invalidate(self, static=False):
+        """次のフレームで画面全体を描き直す（static=Trueなら背景も合成し直す）"""
+        if static:
+            self.static_layer = None
+        self.needs_full = True
+        self.prev_items = {}
+        self.prev_paused = False
+
+    def reset_stats(self):
+        """描画統計をリセット"""
+        self.frames = 0
+        self.blit_area = 0
+        self.draw_time = 0.0
+
+    def stats(self):
+        """1フレームあたりの平均描画面積（ピクセル）と平均描画時間（ミリ秒）を返す"""
+        if not self.frames:
+            return 0, 0.0
+        return self.blit_area / self.frames, self.draw_time / self.frames * 1000
+
+    def build_static_layer(self):
+        """背景、ゲームエリアのオーバーレイ、グリッド線を1枚に合成しておく"""
+        size = self.screen.get_size()
+        layer = pygame.Surface(size)
+
+        # 背景画像を描画
+        layer.blit(self.bg_image, (0, 0))
+
+        # ゲームエリアの半透明オーバーレイ
+        game_area = pygame.Surface((GRID_WIDTH * CELL_SIZE, GRID_HEIGHT * CELL_SIZE), pygame.SRCALPHA)
+        game_area.fill((255, 255, 255, 128))  # 白色の半透明
+        layer.blit(game_area, (0, 0))
+
+        # グリッド線
+        for x in range(GRID_WIDTH + 1):
+            pygame.draw.line(
+                layer,
+                GRAY,
+                (x * CELL_SIZE, 0),
+                (x * CELL_SIZE, GRID_HEIGHT * CELL_SIZE)
+            )
+
+        for y in range(GRID_HEIGHT + 1):
+            pygame.draw.line(
+                layer,
+                GRAY,
+                (0, y * CELL_SIZE),
+                (GRID_WIDTH * CELL_SIZE, y * CELL_SIZE)
+            )
+
+        # ポーズ画面の半透明オーバーレイ
+        pause_overlay = pygame.Surface(size, pygame.SRCALPHA)
+        pause_overlay.fill((0, 0, 0, 128))  # 黒色の半透明
+
+        # 画面と同じピクセル形式にしておくとblitが速い
+        if pygame.display.get_surface() is not None:
+            layer = layer.convert()
+            pause_overlay = pause_overlay.convert_alpha()
+
+        self.static_layer = layer
+        self.pause_overlay = pause_overlay
+        self.static_size = size
+
+    def draw_static(self, rects=None):
+        """合成済みの背景を描画（rects指定時はその矩形だけを1回のblitsで）"""
+        # ウィンドウサイズが変わったら作り直す
+        if self.static_layer is None or self.static_size != self.screen.get_size():
+            self.build_static_layer()
+
+        if rects is None:
+            self.screen.blit(self.static_layer, (0, 0))
+        else:
+            self.screen.blits([(self.static_layer, rect, rect) for rect in rects], doreturn=False)
+
+    def icon_source(self, icon_index, step):
+        """
+        アイコンを描くための(画像, 切り出す範囲)を返す
+
+        stepは半透明の段階で、-1（最後の段階）は不透明。
+        不透明なアイコンはアトラスがあればそこから切り出す。
+        """
+        if step == -1 and self.icon_atlas is not None:
+            return self.icon_atlas, self.icon_rects[icon_index]
+        return self.fade_ramps[icon_index][step], None
+
+    def lookup(self, name, source, build):
+        """sourceから作った引き表を、sourceが別のリストに替わるまで使い回す"""
+        cached = self.lookups.get(name)
+        if cached is None or cached[0] is not source:
+            cached = (source, build(source))
+            self.lookups[name] = cached
+        return cached[1]
+
+    def follow(self, engine):
+        """現在のぷよがSCROLL_MARGINセル内側に入るように表示範囲を動かす"""
+        columns = min(VIEW_COLUMNS, engine.width)
+        rows = min(VIEW_ROWS, engine.height)
+        if engine.current_puyo and not engine.animation_state:
+            xs = [x for x, _ in engine.current_puyo['position']]
+            ys = [y for _, y in engine.current_puyo['position']]
+            margin_x = min(SCROLL_MARGIN, (columns - 1) // 2)
+            margin_y = min(SCROLL_MARGIN, (rows - 1) // 2)
+            self.view_x = min(max(self.view_x, max(xs) + margin_x + 1 - columns), min(xs) - margin_x)
+            self.view_y = min(max(self.view_y, max(ys) + margin_y + 1 - rows), min(ys) - margin_y)
+        self.view_x = min(max(self.view_x, 0), engine.width - columns)
+        self.view_y = min(max(self.view_y, 0), engine.height - rows)
+        return columns, rows
+
+    def collect_items(self, game):
+        """
+        このフレームに描くものを集める
+
+        キーが描画内容（種類、内容、位置）を表し、値はSurface.blits()に渡す(画像, 矩形, 切り出す範囲)。
+        キーが前フレームと同じなら見た目も同じなので描き直す必要はない。
+        """
+        engine = game.engine
+        items = {}
+
+        # 表示範囲（この外のセルは描かない）
+        columns, rows = self.follow(engine)
+        view_x, view_y = self.view_x, self.view_y
+
+        def visible(x, y):
+            return view_x <= x < view_x + columns and view_y <= y < view_y + rows
+
+        # ロジックは固定間隔で進むので、まだ反映していない時間ぶんアニメーションを先に進めて描く
+        animation_time = engine.animation_time + game.frame_lag
+
+        def add_icon(icon_index, px, py, step=-1):
+            key = ('icon', icon_index, step, px, py)
+            source, area = self.icon_source(icon_index, step)
+            items[key] = (source, pygame.Rect(px, py, CELL_SIZE, CELL_SIZE), area)
+
+        def add_text(text, color, pos, font=self.font):
+            x, y = pos
+            key = ('text', text, color, x, y)
+            surface = render_text(font, text, color)
+            items[key] = (surface, surface.get_rect(topleft=(x, y)), None)
+
+        # 消えた後に落ちている途中のぷよ（移動先 -> 元の行）
+        falling = {}
+        fall_progress = 1
+        if engine.animation_state == "delay" and engine.falling_moves:
+            fall_progress = min(animation_time / FALL_DURATION, 1)
+            falling = self.lookup('falling', engine.falling_moves,
+                                  lambda moves: {(x, to_y): from_y for x, from_y, to_y in moves})
+
+        # ボード上のぷよ
+        vanishing = ()
+        if engine.animation_state == "vanishing":
+            vanishing = self.lookup('vanishing', engine.vanishing_puyos, set)
+            progress = min(animation_time / VANISH_DURATION, 1)
+            ramp_length = len(self.fade_ramps[0]) if self.fade_ramps else 1
+            fade_step = round((1 - progress) * (ramp_length - 1))
+        # 空きの行は飛ばす（一番高い列より上には何もない）
+        board = engine.board
+        first_row = max(view_y, engine.height - max(board.heights[view_x:view_x + columns]))
+        for y in range(first_row, view_y + rows):
+            py = (y - view_y) * CELL_SIZE
+            for x in range(view_x, view_x + columns):
+                icon_index = board.get(x, y)
+                if icon_index is None:
+                    continue
+                px = (x - view_x) * CELL_SIZE
+                if (x, y) in vanishing:
+                    # 消えるアニメーション中のぷよは、一番近い段階の半透明画像に
+                    add_icon(icon_index, px, py, fade_step)
+                elif (x, y) in falling:
+                    # 元の行から移動先の行へ補間して描画
+                    from_y = falling[(x, y)]
+                    draw_y = from_y + (y - from_y) * fall_progress - view_y
+                    add_icon(icon_index, px, int(draw_y * CELL_SIZE))
+                else:
+                    add_icon(icon_index, px, py)
+
+        # 現在のぷよの着地位置（ゴースト）
+        if engine.current_puyo and not engine.animation_state and GHOST_ALPHA > 0:
+            position = engine.current_puyo['position']
+            ramp_length = len(self.fade_ramps[0]) if self.fade_ramps else 1
+            ghost_step = round(GHOST_ALPHA * (ramp_length - 1))
+            for i, (x, y) in enumerate(engine.landing_cells(position)):
+                if visible(x, y) and (x, y) not in position:
+                    add_icon(engine.current_puyo['icons'][i], (x - view_x) * CELL_SIZE, (y - view_y) * CELL_SIZE,
+                             ghost_step)
+
+        # 現在のぷよ
+        if engine.current_puyo and not engine.animation_state:
+            for i, (x, y) in enumerate(engine.current_puyo['position']):
+                if visible(x, y):
+                    add_icon(engine.current_puyo['icons'][i], (x - view_x) * CELL_SIZE, (y - view_y) * CELL_SIZE)
+
+        # 次のぷよ
+        if engine.next_puyo:
+            add_text("Next:", BLACK, (HUD_X, 20))
+            for i, icon_index in enumerate(engine.next_puyo['icons']):
+                add_icon(icon_index, HUD_X, 60 + i * CELL_SIZE)
+
+        # スコア、難易度、連鎖数、サウンド状態
+        add_text(f"Score: {engine.score}", BLACK, (HUD_X, 180))
+        add_text(f"難易度: {game.difficulty}", BLACK, (HUD_X, 220))
+        if engine.chain_count > 0:
+            add_text(f"{engine.chain_count}連鎖!", RED, (HUD_X, 260))
+        add_text(f"サウンド: {'ON' if game.sound_on else 'OFF'}", BLACK, (HUD_X, 300))
+        add_text("Sキーで切替", GRAY, (HUD_X, 330))
+        if columns < engine.width or rows < engine.height:
+            add_text(f"盤面 {engine.width}x{engine.height}", BLACK, (HUD_X, 460))
+            add_text(f"表示 {view_x},{view_y}", GRAY, (HUD_X, 490))
+        if game.autoplayer is not None:
+            add_text("オートプレイ中", RED, (HUD_X, 380))
+            add_text("Aキーで解除", GRAY, (HUD_X, 410))
+
+        # ゲームオーバー表示
+        if engine.game_over:
+            add_text("GAME OVER", RED, (GRID_WIDTH * CELL_SIZE // 2 - 80, GRID_HEIGHT * CELL_SIZE // 2))
+            add_text("Rキーでリスタート", BLACK, (GRID_WIDTH * CELL_SIZE // 2 - 100, GRID_HEIGHT * CELL_SIZE // 2 + 40))
+            add_text("Mキーで難易度選択", BLACK, (GRID_WIDTH * CELL_SIZE // 2 - 100, GRID_HEIGHT * CELL_SIZE // 2 + 80))
+
+        # フレーム時間の計測結果（ボードの下）
+        profiler = game.profiler
+        if profiler.enabled:
+            line_height = self.overlay_font.get_linesize()
+            for i, line in enumerate(profiler.overlay):
+                add_text(line, BLACK, (10, GRID_HEIGHT * CELL_SIZE + 10 + i * line_height), self.overlay_font)
+
+        return items
+
+    def draw_pause(self):
+        """ポーズ画面を重ねて描画"""
+        # 半透明のオーバーレイ
+        self.screen.blit(self.pause_overlay, (0, 0))
+
+        # ポーズテキスト
+        pause_text = render_text(self.font, "PAUSE", WHITE)
+        self.screen.blit(pause_text, (SCREEN_WIDTH // 2 - pause_text.get_width() // 2, SCREEN_HEIGHT // 2 - 50))
+
+        # 操作説明
+        resume_text = render_text(self.font, "Pキーで再開", WHITE)
+        self.screen.blit(resume_text, (SCREEN_WIDTH // 2 - resume_text.get_width() // 2, SCREEN_HEIGHT // 2 + 10))
+
+    def draw(self, game):
+        """
+        ゲーム画面を描画し、画面に送るべき矩形のリストを返す
+
+        画面全体を描き直した場合はNoneを返す（呼び出し側はdisplay.flipする）。
+        """
+        start = time.perf_counter()
+        items = self.collect_items(game)
+
+        # 変わった描画要素の、前フレームと今フレームの矩形を描き直す
+        dirty = []
+        if not (self.full_redraw or self.needs_full or game.paused != self.prev_paused):
+            changed = items.keys() ^ self.prev_items.keys()
+            for key in changed:
+                value = items[key] if key in items else self.prev_items[key]
+                dirty.append(value[1])
+
+        # ポーズ中はオーバーレイが画面全体にかかるので、何か変わったら全体を描き直す
+        full = self.full_redraw or self.needs_full or game.paused != self.prev_paused or (game.paused and dirty)
+
+        if full:
+            self.draw_static()
+            self.screen.blits(list(items.values()), doreturn=False)
+            if game.paused:
+                self.draw_pause()
+            area = SCREEN_WIDTH * SCREEN_HEIGHT
+            rects = None
+        else:
+            # 描き直す範囲にかかる要素は全体を描き直すので、その矩形も背景から戻す。
+            # 戻した範囲にかかる別の要素も描き直す必要があるので、増えなくなるまで繰り返す
+            restore = list(dirty)
+            redraw = set()
+            pending = dirty
+            while pending:
+                added = []
+                for key, value in items.items():
+                    if key not in redraw and value[1].collidelist(pending) != -1:
+                        redraw.add(key)
+                        added.append(value[1])
+                restore.extend(added)
+                pending = added
+
+            # 背景の復元と要素の描画をそれぞれ1回のblitsで行う（重なり順はitemsの順）
+            if restore:
+                self.draw_static(restore)
+                self.screen.blits([value for key, value in items.items() if key in redraw], doreturn=False)
+            rects = restore
+            area = sum(rect.width * rect.height for rect in restore)
+
+        self.prev_items = items
+        self.prev_paused = game.paused
+        self.needs_full = False
+
+        self.frames += 1
+        self.blit_area += area
+        self.draw_time += time.perf_counter() - start
+        return rects
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+リプレイの記録と再生
+
+ゲームごとのシードと、入力（何ステップ目にどのアクションか）だけを記録する。
+エンジンは同じシードと同じ入力で同じように進むので、ディスプレイなしで
+最大速度で再実行し、最後のスコアと盤面のハッシュが記録と一致するか確かめられる。
+
+ファイル形式（リトルエンディアン）:
+    ヘッダー: マジック"PUYR"、バージョン、アイコン数、幅と高さ（2バイトずつ）、シード、
+              ロジックの更新回数（1秒あたり）、総ステップ数、最終スコア、盤面のハッシュ（8バイト）
+    入力: (前の入力からのステップ差 << 3 | アクション番号) の可変長整数の並び
+"""
+import argparse
+import hashlib
+import os
+import struct
+import sys
+import time
+
+from engine import PuyoEngine, CascadeCache, MOVE_LEFT, MOVE_RIGHT, SOFT_DROP, ROTATE, HARD_DROP
+
+MAGIC = b"PUYR"
+VERSION = 2
+HEADER = struct.Struct("<4sBBHHIHII8s")
+# 読み込める古いバージョンのヘッダー（バージョン1は幅と高さが1バイトで、255までしか書けない）
+HEADERS = {1: struct.Struct("<4sBBBBIHII8s"), VERSION: HEADER}
+
+# アクションの番号（ファイルに書くので順番を変えないこと。追加は末尾に）
+ACTION_CODES = [MOVE_LEFT, MOVE_RIGHT, SOFT_DROP, ROTATE, HARD_DROP]
+ACTION_BITS = 3
+
+
+def board_hash(board):
+    """盤面の内容の8バイトのハッシュを返す（ボードの実装によらず同じ値）"""
+    cells = bytes(255 if icon is None else icon for row in board.to_grid() for icon in row)
+    return hashlib.blake2b(cells, digest_size=8).digest()
+
+
+def encode_varint(value, out):
+    """0以上の整数を可変長（7ビットずつ）でoutに追加"""
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, pos):
+    """可変長整数を読み、(値, 次の位置)を返す"""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class ReplayRecorder:
+    """エンジンに渡した入力を記録する（engine.stepの直前にrecordを呼ぶ）"""
+
+    def __init__(self, engine, tick_rate):
+        self.engine = engine
+        self.tick_rate = tick_rate
+        self.inputs = []  # (ステップ番号, アクション)
+        self.saved = False
+
+    def record(self, actions):
+        """次のステップで適用するアクションを記録"""
+        for action in actions:
+            self.inputs.append((self.engine.steps, action))
+
+    def to_bytes(self):
+        """リプレイファイルの内容を返す"""
+        engine = self.engine
+        data = bytearray(HEADER.pack(
+            MAGIC, VERSION, engine.icon_count, engine.width, engine.height, engine.seed,
+            self.tick_rate, engine.steps, engine.score, board_hash(engine.board)
+        ))
+        last_step = 0
+        for step, action in self.inputs:
+            encode_varint((step - last_step) << ACTION_BITS | ACTION_CODES.index(action), data)
+            last_step = step
+        return bytes(data)
+
+    def save(self, path):
+        """リプレイファイルに書き出す"""
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+        self.saved = True
+
+
+def load_replay(path):
+    """リプレイファイルを読み込んで辞書で返す"""
+    with open(path, "rb") as f:
+        data = f.read()
+    header = HEADERS.get(data[4]) if len(data) > 4 else None
+    if header is None or data[:4] != MAGIC:
+        raise ValueError(f"リプレイファイルではないか、対応していないバージョンです: {path}")
+    magic, version, icon_count, width, height, seed, tick_rate, steps, score, final_hash = header.unpack_from(data)
+
+    inputs = []
+    step = 0
+    pos = header.size
+    while pos < len(data):
+        value, pos = decode_varint(data, pos)
+        step += value >> ACTION_BITS
+        inputs.append((step, ACTION_CODES[value & ((1 << ACTION_BITS) - 1)]))
+
+    return {
+        'icon_count': icon_count,
+        'width': width,
+        'height': height,
+        'seed': seed,
+        'tick_rate': tick_rate,
+        'steps': steps,
+        'score': score,
+        'board_hash': final_hash,
+        'inputs': inputs,
+    }
+
+
+def run_replay(replay, board_backend="bitboard", cascade_cache=None):
+    """リプレイを最大速度で再実行し、最後の状態のエンジンを返す"""
+    engine = PuyoEngine(replay['icon_count'], replay['width'], replay['height'],
+                        board_backend=board_backend, seed=replay['seed'], cascade_cache=cascade_cache)
+    dt = 1 / replay['tick_rate']
+    inputs = replay['inputs']
+    next_input = 0
+    for step in range(replay['steps']):
+        actions = []
+        while next_input < len(inputs) and inputs[next_input][0] == step:
+            actions.append(inputs[next_input][1])
+            next_input += 1
+        engine.step(dt, actions)
+    return engine
+
+
+def verify_replay(replay, board_backend="bitboard", cascade_cache=None):
+    """リプレイを再実行し、(スコアと盤面が記録と一致したか, エンジン, かかった秒数)を返す"""
+    start = time.perf_counter()
+    engine = run_replay(replay, board_backend, cascade_cache)
+    elapsed = time.perf_counter() - start
+    ok = engine.score == replay['score'] and board_hash(engine.board) == replay['board_hash']
+    return ok, engine, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="リプレイをディスプレイなしで再実行して結果を確かめる")
+    parser.add_argument("paths", nargs="+", help="リプレイファイル（.puyo）")
+    parser.add_argument("--backend", default="bitboard", help="ボードの実装（list または bitboard）")
+    parser.add_argument("--cascade-cache", type=int, default=0,
+                        help="連鎖の結果を覚えておく盤面の数（0で使わない。全リプレイで共有）")
+    args = parser.parse_args()
+
+    cascade_cache = CascadeCache(args.cascade_cache) if args.cascade_cache else None
+    failed = 0
+    for path in args.paths:
+        replay = load_replay(path)
+        ok, engine, elapsed = verify_replay(replay, args.backend, cascade_cache)
+        if not ok:
+            failed += 1
+        rate = replay['steps'] / elapsed if elapsed else 0
+        print(f"{os.path.basename(path)}: {'一致' if ok else '不一致'}  "
+              f"スコア {engine.score}（記録 {replay['score']}）  "
+              f"{replay['steps']}ステップ {len(replay['inputs'])}入力  {rate:,.0f}ステップ/秒")
+
+    if cascade_cache is not None:
+        hits, misses, hit_rate, entries = cascade_cache.stats()
+        print(f"連鎖キャッシュ: ヒット {hits} ミス {misses}（{hit_rate:.0%}）  {entries}盤面")
+
+    if failed:
+        print(f"{failed}件のリプレイが一致しませんでした")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+文字列画像のキャッシュ
+
+HUDやメニューの文字列は毎フレーム同じものを描くので、font.renderの結果を
+(フォント, サイズ, 文字列, 色, アンチエイリアス)ごとに覚えておく。
+日本語のレンダリングは重いので効果が大きい。
+古いものから捨てる（LRU）ので、スコアのように変わり続ける文字列があっても
+メモリは一定以上増えない。
+"""
+from collections import OrderedDict
+
+# キャッシュの上限
+TEXT_CACHE_MAX_ENTRIES = 256
+TEXT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+class TextCache:
+    def __init__(self, max_entries=TEXT_CACHE_MAX_ENTRIES, max_bytes=TEXT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, font, text, color, antialias=True, size=None):
+        """
+        font.render(text, antialias, color)と同じ画像を返す
+
+        sizeはキーを区別するためのもので、省略時はフォントの高さを使う。
+        返した画像は共有されるので、呼び出し側で書き換えないこと。
+        """
+        if size is None:
+            size = font.get_height()
+        key = (font, size, text, tuple(color), antialias)
+
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.entries[key] = surface
+        self.bytes += surface.get_pitch() * surface.get_height()
+
+        # 上限を超えたら古いものから捨てる
+        while len(self.entries) > self.max_entries or (self.bytes > self.max_bytes and len(self.entries) > 1):
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= old.get_pitch() * old.get_height()
+            self.evictions += 1
+
+        return surface
+
+    def clear(self):
+        """キャッシュを空にする（統計は残す）"""
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """ヒット数、ミス数、ヒット率、エントリ数、使用バイト数、追い出し数を返す"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'evictions': self.evictions,
+        }
+
+
+# プロセス全体で共有するキャッシュ
+text_cache = TextCache()
+
+
+def render_text(font, text, color, antialias=True):
+    """共有キャッシュを使って文字列を描画した画像を返す"""
+    return text_cache.render(font, text, color, antialias)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+自動対局でのトーナメント
+
+難易度（アイコンの種類数）、落下速度、方策の組み合わせごとに、シード固定のゲームを
+ディスプレイなしで大量に遊ばせ、スコアや連鎖数の分布を集計する。
+ゲームは全コアのプロセスプールに配り、1ゲーム終わるごとに結果をJSON Linesで
+ファイルに追記するので、途中で止めてもそこまでの結果は残る。
+
+方策はPOLICIESに名前で登録する。choose(engine)で(最終位置, そこまでのアクション)を
+返すオブジェクトを作る関数で、あとはbot.AutoPlayerがアクションを出す。
+"""
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bot import Bot, AutoPlayer, AUTOPLAY_INTERVAL, BOT_TIME_BUDGET
+from engine import PuyoEngine, DIFFICULTY_LEVELS
+from profiler import percentile
+
+# ロジックの更新間隔（main.pyのTICK_RATEと同じ）
+TICK_RATE = 120
+
+# 1ゲームの最大ステップ数（超えたら打ち切り）
+MAX_STEPS = 200000
+
+
+class RandomPolicy:
+    """置ける場所から無作為に選ぶ"""
+
+    def __init__(self, seed):
+        # エンジンの乱数を使うとぷよの並びが変わるので、別の乱数を使う
+        self.rng = random.Random(seed)
+
+    def choose(self, engine):
+        placements = engine.enumerate_placements()
+        position = self.rng.choice(sorted(placements))
+        return position, placements[position]
+
+
+# 方策の名前 -> (icon_count, width, height, seed)から方策を作る関数
+POLICIES = {
+    "random": lambda icon_count, width, height, seed: RandomPolicy(seed),
+    # 思考時間0なので1手目の評価だけで選ぶ
+    "greedy": lambda icon_count, width, height, seed: Bot(icon_count, width, height, "bitboard", time_budget=0),
+    "bot": lambda icon_count, width, height, seed: Bot(icon_count, width, height, "bitboard"),
+}
+
+
+def play_game(job):
+    """1ゲーム遊ばせて結果の辞書を返す（プロセスプールで実行する）"""
+    # 同じコアを他のプロセスと分け合っても変わらないように、CPU時間で測る
+    start = time.process_time()
+    engine = PuyoEngine(job['icon_count'], board_backend="bitboard", seed=job['seed'])
+    if job['fall_speed'] is not None:
+        engine.fall_speed = job['fall_speed']
+    policy = POLICIES[job['policy']](job['icon_count'], engine.width, engine.height, job['seed'])
+    player = AutoPlayer(policy, interval=job['interval'])
+
+    dt = 1 / TICK_RATE
+    pieces = 0
+    max_chain = 0
+    while not engine.game_over and engine.steps < job['max_steps']:
+        for event in engine.step(dt, player.next_actions(engine)):
+            if event['type'] == "lock":
+                pieces += 1
+            elif event['type'] == "chain":
+                max_chain = max(max_chain, event['chain_count'])
+
+    return {
+        'difficulty': job['difficulty'],
+        'icon_count': job['icon_count'],
+        'fall_speed': engine.fall_speed,
+        'policy': job['policy'],
+        'seed': job['seed'],
+        'score': engine.score,
+        'max_chain': max_chain,
+        'pieces': pieces,
+        'steps': engine.steps,
+        # 出現位置がふさがった（ゲームオーバー）か、最大ステップ数で打ち切ったか
+        'end': "spawn_blocked" if engine.game_over else "step_limit",
+        'cpu_seconds': round(time.process_time() - start, 4),
+    }
+
+
+def make_jobs(difficulties, policies, fall_speeds, games, seed, interval, max_steps):
+    """組み合わせごとにgamesゲームぶんのジョブを作る（同じシードの並びを全組み合わせで使う）"""
+    jobs = []
+    for difficulty in difficulties:
+        for policy in policies:
+            for fall_speed in fall_speeds:
+                for i in range(games):
+                    jobs.append({
+                        'difficulty': difficulty,
+                        'icon_count': DIFFICULTY_LEVELS[difficulty],
+                        'fall_speed': fall_speed,
+                        'policy': policy,
+                        'seed': seed + i,
+                        'interval': interval,
+                        'max_steps': max_steps,
+                    })
+    return jobs
+
+
+def summarize(results):
+    """(難易度, 方策, 落下速度)ごとにスコアなどの分布をまとめた辞書を返す"""
+    groups = {}
+    for result in results:
+        key = (result['difficulty'], result['policy'], result['fall_speed'])
+        groups.setdefault(key, []).append(result)
+
+    summary = {}
+    for key, group in groups.items():
+        scores = sorted(result['score'] for result in group)
+        pieces = sorted(result['pieces'] for result in group)
+        chains = {}
+        ends = {}
+        for result in group:
+            chains[result['max_chain']] = chains.get(result['max_chain'], 0) + 1
+            ends[result['end']] = ends.get(result['end'], 0) + 1
+        summary[key] = {
+            'games': len(group),
+            'score_mean': sum(scores) / len(scores),
+            'score': {p: percentile(scores, p) for p in (10, 50, 90)},
+            'score_max': scores[-1],
+            'pieces_mean': sum(pieces) / len(pieces),
+            'pieces_p50': percentile(pieces, 50),
+            'max_chain': dict(sorted(chains.items())),
+            'end': ends,
+        }
+    return summary
+
+
+def print_summary(summary):
+    """集計結果を表示"""
+    for (difficulty, policy, fall_speed), stats in summary.items():
+        score = stats['score']
+        chains = "  ".join(f"{chain}連鎖:{count}" for chain, count in stats['max_chain'].items())
+        ends = "  ".join(f"{end}:{count}" for end, count in stats['end'].items())
+        print(f"{difficulty} {policy:6} 落下{fall_speed:.2f}秒  {stats['games']}ゲーム")
+        print(f"  スコア 平均 {stats['score_mean']:.1f}  p10/p50/p90 {score[10]}/{score[50]}/{score[90]}  "
+              f"最大 {stats['score_max']}")
+        print(f"  置いた数 平均 {stats['pieces_mean']:.1f}  p50 {stats['pieces_p50']}")
+        print(f"  最大連鎖 {chains}")
+        print(f"  終了理由 {ends}")
+
+
+def run_tournament(jobs, output, workers=None):
+    """ジョブをプロセスプールで実行し、1ゲーム終わるたびに（終わった順で）結果をoutputへ追記する。結果のリストを返す"""
+    results = []
+    with open(output, "a") as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        # 1ゲームずつ渡す（まとめて渡すと、遅いゲームが同じまとまりの結果の書き出しを止めてしまう）
+        futures = [executor.submit(play_game, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            f.flush()
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="方策ごとに大量のゲームをディスプレイなしで遊ばせて結果を集計する")
+    parser.add_argument("--difficulty", action="append", choices=list(DIFFICULTY_LEVELS),
+                        help="難易度（複数指定可、省略時はすべて）")
+    parser.add_argument("--policy", action="append", choices=list(POLICIES),
+                        help="方策（複数指定可、省略時はrandom）")
+    parser.add_argument("--fall-speed", type=float, action="append",
+                        help="自動落下の間隔（秒、複数指定可、省略時はエンジンの初期値）")
+    parser.add_argument("--games", type=int, default=100, help="組み合わせごとのゲーム数")
+    parser.add_argument("--seed", type=int, default=0, help="最初のシード")
+    parser.add_argument("--interval", type=int, default=AUTOPLAY_INTERVAL,
+                        help="アクションを出す間隔（ロジック更新回数）")
+    parser.add_argument("--max-steps", type=int, default=MAX_STEPS, help="1ゲームの最大ステップ数")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（省略時はCPUコア数）")
+    parser.add_argument("--output", default=None,
+                        help="結果を追記するJSON Linesファイル（省略時はtournament_日時.jsonl）")
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.difficulty or list(DIFFICULTY_LEVELS), args.policy or ["random"],
+                     args.fall_speed or [None], args.games, args.seed, args.interval, args.max_steps)
+    output = args.output or time.strftime("tournament_%Y%m%d_%H%M%S.jsonl")
+    workers = args.workers or os.cpu_count()
+    if "bot" in (args.policy or []):
+        print(f"botは1手{BOT_TIME_BUDGET * 1000:.0f}msで打ち切るので、負荷によって結果が変わることがあります")
+
+    start = time.perf_counter()
+    results = run_tournament(jobs, output, workers)
+    elapsed = time.perf_counter() - start
+
+    print_summary(summarize(results))
+    cpu_seconds = sum(result['cpu_seconds'] for result in results)
+    print(f"{len(results)}ゲーム {elapsed:.1f}秒（{workers}プロセス、CPU時間の合計 {cpu_seconds:.1f}秒、"
+          f"{cpu_seconds / elapsed if elapsed else 0:.1f}倍）  結果: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import math
 import os
 import random
-import shutil
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 
 # AWSアイコンのディレクトリ
@@ -12,56 +16,223 @@ OUTPUT_DIR = "./assets"
 NUM_ICONS = 20
 # アイコンのサイズ
 ICON_SIZE = (50, 50)
+# 元にするアイコンのサイズ（AWSアイコンパッケージのディレクトリ名）
+SOURCE_SIZE = "64"
+# 縮小に使うフィルタ
+RESAMPLE_FILTER = "LANCZOS"
+# アイコンを1枚にまとめたアトラス画像と、各アイコンの位置を書いたマニフェスト
+ATLAS_PATH = os.path.join(OUTPUT_DIR, "icons_atlas.png")
+ATLAS_MANIFEST_PATH = os.path.join(OUTPUT_DIR, "icons_atlas.json")
+# 変換済みアイコンの元ファイルのハッシュと変換パラメータを記録するマニフェスト
+ICONS_MANIFEST_PATH = os.path.join(OUTPUT_DIR, "icons_manifest.json")
 
-def find_aws_icons():
+def find_aws_icons(source_size=SOURCE_SIZE):
     """AWSアイコンを検索する"""
     icons = []
     # 各カテゴリディレクトリを探索
-    for category in os.listdir(AWS_ICONS_DIR):
+    for category in sorted(os.listdir(AWS_ICONS_DIR)):
         category_path = os.path.join(AWS_ICONS_DIR, category)
         if os.path.isdir(category_path) and category.startswith("Arch_"):
-            # 64x64サイズのアイコンを探す
-            icon_dir = os.path.join(category_path, "64")
+            # 指定サイズのアイコンを探す
+            icon_dir = os.path.join(category_path, source_size)
             if os.path.exists(icon_dir):
-                for icon in os.listdir(icon_dir):
-                    if icon.endswith("_64.png"):
+                for icon in sorted(os.listdir(icon_dir)):
+                    if icon.endswith(f"_{source_size}.png"):
                         icons.append(os.path.join(icon_dir, icon))
     return icons
 
-def update_icons():
-    """アイコンを更新する"""
-    # 既存のアイコンを削除
-    for file in os.listdir(OUTPUT_DIR):
-        if file.startswith("icon_") and file.endswith(".png"):
-            os.remove(os.path.join(OUTPUT_DIR, file))
-    
+def file_hash(path):
+    """ファイルの内容のSHA-256を返す"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest():
+    """前回の変換結果のマニフェストを読み込む（無ければ空）"""
+    try:
+        with open(ICONS_MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"params": None, "icons": {}}
+
+def save_manifest(manifest):
+    """マニフェストを書き出す"""
+    with open(ICONS_MANIFEST_PATH, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+def convert_icon(job):
+    """
+    1つのアイコンを変換する（プロセスプールのワーカーで実行）
+
+    元ファイルと変換パラメータが前回と同じで、出力も前回書いたままなら何もしない。
+    (出力パス, マニフェストのエントリ, 書き直したかどうか, エラー)を返す。
+    変換できなかった場合はエントリに元ファイルとエラーだけを入れる（ほかのアイコンは続ける）。
+    次回も同じアイコンを選び、その番号だけ変換し直す。
+    """
+    source_path, output_path, params, previous = job
+    try:
+        return convert_one(source_path, output_path, params, previous) + (None,)
+    except Exception as e:
+        error = f"Error processing {source_path}: {e}"
+        return output_path, {"source": source_path, "error": error}, False, error
+
+def convert_one(source_path, output_path, params, previous):
+    """convert_iconの本体。(出力パス, マニフェストのエントリ, 書き直したかどうか)を返す"""
+    source_sha256 = file_hash(source_path)
+
+    if (previous is not None
+            and previous["source"] == source_path
+            and "error" not in previous
+            and previous["source_sha256"] == source_sha256
+            and previous["params"] == params
+            and os.path.exists(output_path)
+            and file_hash(output_path) == previous["output_sha256"]):
+        return output_path, previous, False
+
+    # 高品質なフィルタで縮小する
+    with Image.open(source_path) as img:
+        img = img.resize(tuple(params["size"]), getattr(Image.Resampling, params["filter"]))
+        img.save(output_path)
+
+    entry = {
+        "source": source_path,
+        "source_sha256": source_sha256,
+        "params": params,
+        "output_sha256": file_hash(output_path),
+    }
+    return output_path, entry, True
+
+def select_icons(aws_icons, manifest, count, reselect, seed):
+    """
+    使うアイコンを選ぶ
+
+    前回選んだアイコンがすべて残っていれば同じものを使う（変換を省略できる）。
+    """
+    previous = [manifest["icons"].get(f"icon_{i}.png", {}).get("source") for i in range(count)]
+    if not reselect and all(source in aws_icons for source in previous):
+        return previous
+
+    # ランダムに選択
+    if count < len(aws_icons):
+        return random.Random(seed).sample(aws_icons, count)
+    return aws_icons
+
+def find_output_icons():
+    """assetsフォルダのicon_{i}.pngを番号順に返す（番号が途切れたところまで）"""
+    paths = []
+    while True:
+        path = os.path.join(OUTPUT_DIR, f"icon_{len(paths)}.png")
+        if not os.path.exists(path):
+            return paths
+        paths.append(path)
+
+def build_atlas(icon_paths):
+    """アイコンを1枚の画像に詰めて、アトラス画像とマニフェストを書き出す"""
+    if not icon_paths:
+        print("No icons to pack into an atlas")
+        return
+
+    # ほぼ正方形になるように並べる
+    columns = math.ceil(math.sqrt(len(icon_paths)))
+    rows = math.ceil(len(icon_paths) / columns)
+    width, height = ICON_SIZE
+    atlas = Image.new("RGBA", (columns * width, rows * height), (0, 0, 0, 0))
+
+    rects = []
+    for i, icon_path in enumerate(icon_paths):
+        x = (i % columns) * width
+        y = (i // columns) * height
+        with Image.open(icon_path) as img:
+            img = img.convert("RGBA")
+            if img.size != ICON_SIZE:
+                img = img.resize(ICON_SIZE, getattr(Image.Resampling, RESAMPLE_FILTER))
+            atlas.paste(img, (x, y))
+        rects.append([x, y, width, height])
+
+    atlas.save(ATLAS_PATH)
+    with open(ATLAS_MANIFEST_PATH, "w") as f:
+        json.dump({"icon_size": list(ICON_SIZE), "icons": rects}, f, indent=2)
+    print(f"Saved {ATLAS_PATH} ({len(rects)} icons)")
+
+def update_icons(count=NUM_ICONS, source_size=SOURCE_SIZE, reselect=False, seed=None, workers=None):
+    """
+    アイコンを更新する
+
+    変換はプロセスプールで並列に行い、元ファイルと変換パラメータが前回と
+    同じアイコンは書き直さない。countがNoneならすべてのアイコンを取り込む。
+    """
     # AWSアイコンを検索
-    aws_icons = find_aws_icons()
+    aws_icons = find_aws_icons(source_size)
     print(f"Found {len(aws_icons)} AWS icons")
-    
-    # ランダムに選択
-    if len(aws_icons) > NUM_ICONS:
-        selected_icons = random.sample(aws_icons, NUM_ICONS)
-    else:
-        selected_icons = aws_icons
-    
-    # アイコンをコピーしてリサイズ
+    if count is None:
+        count = len(aws_icons)
+
+    manifest = load_manifest()
+    params = {"size": list(ICON_SIZE), "filter": RESAMPLE_FILTER}
+    selected_icons = select_icons(aws_icons, manifest, count, reselect, seed)
+
+    # アイコンをリサイズして保存（変わったものだけ）
+    jobs = []
     for i, icon_path in enumerate(selected_icons):
-        output_path = os.path.join(OUTPUT_DIR, f"icon_{i}.png")
-        try:
-            # PILを使用してリサイズ
-            img = Image.open(icon_path)
-            img = img.resize(ICON_SIZE)
-            img.save(output_path)
-            print(f"Saved {output_path}")
-        except Exception as e:
-            print(f"Error processing {icon_path}: {e}")
-    
-    print(f"Updated {len(selected_icons)} icons")
+        name = f"icon_{i}.png"
+        jobs.append((icon_path, os.path.join(OUTPUT_DIR, name), params, manifest["icons"].get(name)))
+
+    entries = {}
+    failed = 0
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for output_path, entry, changed, error in executor.map(convert_icon, jobs, chunksize=8):
+            # 変換できなかった番号も元ファイルは載せておき、次回その番号だけ変換し直す（前の出力は残す）
+            entries[os.path.basename(output_path)] = entry
+            if error is not None:
+                print(error)
+                failed += 1
+            elif changed:
+                written += 1
+                print(f"Saved {output_path}")
+
+    # 今回使わない番号の古いアイコンを削除
+    removed = 0
+    for file in os.listdir(OUTPUT_DIR):
+        if file.startswith("icon_") and file.endswith(".png") and file not in entries:
+            os.remove(os.path.join(OUTPUT_DIR, file))
+            removed += 1
+
+    save_manifest({"params": params, "icons": entries})
+    unchanged = len(selected_icons) - written - failed
+    print(f"Updated {written} of {len(selected_icons)} icons ({unchanged} unchanged, {removed} removed, "
+          f"{failed} failed)")
+
+    # アトラスも作り直す（アイコンが変わっていなければそのまま）
+    if written or removed or not os.path.exists(ATLAS_PATH):
+        build_atlas(find_output_icons())
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AWSアイコンを更新する")
+    parser.add_argument("--atlas-only", action="store_true",
+                        help="assets/icon_*.pngからアトラスだけを作り直す")
+    parser.add_argument("--all", action="store_true",
+                        help="見つかったアイコンをすべて取り込む")
+    parser.add_argument("--count", type=int, default=NUM_ICONS,
+                        help=f"取り込むアイコンの数（デフォルト: {NUM_ICONS}）")
+    parser.add_argument("--source-size", default=SOURCE_SIZE,
+                        help=f"元にするアイコンのサイズ（デフォルト: {SOURCE_SIZE}）")
+    parser.add_argument("--reselect", action="store_true",
+                        help="前回と同じアイコンが使えても選び直す")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="アイコンを選ぶ乱数のシード")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="変換に使うプロセス数（デフォルト: CPUコア数）")
+    args = parser.parse_args()
+
     # assetsディレクトリが存在することを確認
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
-    
-    update_icons()
\ No newline at end of file
+
+    if args.atlas_only:
+        build_atlas(find_output_icons())
+    else:
+        update_icons(None if args.all else args.count, args.source_size,
+                     args.reselect, args.seed, args.workers)